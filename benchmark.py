@@ -0,0 +1,265 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import convert_aistudio_to_openwebui as converter
+
+# Vocabulary for synthetic message text (a little non-ASCII on purpose)
+WORDS = ("the model prompt response token context gemini function python data "
+         "result value error test chunk stream memory export import chat user "
+         "assistant reasoning because therefore however naïve café résumé 数据 ✓").split()
+
+PHASES = ("read", "parse", "convert", "serialize", "write")
+
+def _text(rng, size):
+    """Random words totalling roughly size characters"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+def generate_aistudio_prompt(rng, chunks=50, thought_ratio=0.3, text_size=1000, parts_ratio=0.5):
+    """
+    Generate a synthetic AIStudio prompt
+
+    Args:
+        rng (random.Random): Random source
+        chunks (int): Number of user/model turns (thought chunks come on top)
+        thought_ratio (float): Probability that a model turn is preceded by
+            a thought chunk
+        text_size (int): Average text length of a chunk in characters
+        parts_ratio (float): Probability that a chunk also carries a parts array
+
+    Returns:
+        dict: AIStudio prompt data
+    """
+    prompt_chunks = []
+    for i in range(chunks):
+        size = max(1, int(rng.expovariate(1 / text_size)))
+        if i % 2 == 0:
+            prompt_chunks.append({"text": _text(rng, size), "role": "user",
+                                  "tokenCount": size // 4})
+            continue
+
+        if rng.random() < thought_ratio:
+            thought = _text(rng, size)
+            prompt_chunks.append({"text": thought, "role": "model", "isThought": True,
+                                  "thinkingBudget": -1,
+                                  "parts": [{"text": thought, "thought": True}],
+                                  "tokenCount": size // 4})
+        text = _text(rng, size)
+        chunk = {"text": text, "role": "model", "finishReason": "STOP",
+                 "tokenCount": size // 4}
+        if rng.random() < parts_ratio:
+            half = len(text) // 2
+            chunk["parts"] = [{"text": text[:half]}, {"text": text[half:]}]
+        prompt_chunks.append(chunk)
+
+    return {
+        "runSettings": {
+            "temperature": 1,
+            "model": rng.choice(["models/gemini-2.5-pro", "models/gemini-2.5-flash"]),
+            "topP": 0.95,
+            "topK": 64,
+            "maxOutputTokens": 65536,
+            "safetySettings": [],
+            "enableCodeExecution": False,
+            "enableSearchAsATool": False,
+            "enableBrowseAsATool": False,
+            "enableAutoFunctionResponse": False
+        },
+        "systemInstruction": {},
+        "chunkedPrompt": {
+            "chunks": prompt_chunks,
+            "pendingInputs": [{"text": "", "role": "user"}]
+        }
+    }
+
+def generate_corpus(directory, files=100, seed=0, **prompt_options):
+    """
+    Write a synthetic AIStudio export of the given size to directory
+
+    Args:
+        directory (str): Target directory (created if needed)
+        files (int): Number of prompt files
+        seed (int): Random seed, so corpora are reproducible
+        **prompt_options: Passed to generate_aistudio_prompt
+
+    Returns:
+        int: Total size of the corpus in bytes
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    total = 0
+    for i in range(files):
+        # AIStudio files on Drive usually have no extension
+        name = f"Synthetic chat {i:05d}" + (".json" if i % 3 == 0 else "")
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(generate_aistudio_prompt(rng, **prompt_options), f, ensure_ascii=False, indent=2)
+        total += os.path.getsize(path)
+    return total
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def measure_phases(input_dir, output_dir, compact=False, json_backend="auto", history_only=False):
+    """
+    Time each pipeline phase separately over every file in input_dir
+
+    The phases run back to back in this process: read the raw file, parse
+    it with the JSON backend, convert the chunks, serialize the result and
+    write it out. Subdirectories are skipped, as are files that don't look
+    like AIStudio prompts, don't parse or hold no messages.
+
+    Returns:
+        dict: Total seconds per phase
+    """
+    backend = converter.get_json_backend(json_backend)
+    timings = dict.fromkeys(PHASES, 0.0)
+    os.makedirs(output_dir, exist_ok=True)
+    for name in sorted(entry.name for entry in os.scandir(input_dir) if entry.is_file()):
+        start = time.perf_counter()
+        with open(os.path.join(input_dir, name), 'rb') as f:
+            raw = f.read()
+        timings["read"] += time.perf_counter() - start
+        if not converter.looks_like_aistudio(raw[:converter.SNIFF_BYTES]):
+            continue
+
+        start = time.perf_counter()
+        try:
+            aistudio_data = backend.loads(raw)
+        except ValueError:
+            continue
+        timings["parse"] += time.perf_counter() - start
+        if not isinstance(aistudio_data, dict):
+            continue
+
+        start = time.perf_counter()
+        converted = converter.convert_aistudio_stream(aistudio_data, name)
+        if converted is None:
+            continue
+        chat, messages = converted
+        messages = list(messages)
+        timings["convert"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer = io.StringIO()
+        converter.write_openwebui_json(buffer, (chat, iter(messages)), compact=compact, backend=backend,
+                                       history_only=history_only)
+        output = buffer.getvalue()
+        timings["serialize"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(os.path.join(output_dir, name + '.json'), 'w', encoding='utf-8') as f:
+            f.write(output)
+        timings["write"] += time.perf_counter() - start
+    return timings
+
+def measure_batch(input_dir, output_dir, workers=None, compact=False, json_backend="auto",
+                  history_only=False):
+    """
+    Time an end-to-end process_directory run
+
+    Returns:
+        tuple: (seconds, successful conversions)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        success_count, _ = converter.process_directory(input_dir, output_dir, workers=workers,
+                                                       compact=compact, json_backend=json_backend,
+                                                       history_only=history_only)
+        elapsed = time.perf_counter() - start
+    return elapsed, success_count
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AIStudio to OpenWebUI conversion on a synthetic export')
+    parser.add_argument('--files', type=int, default=200, help='Number of synthetic chat files')
+    parser.add_argument('--chunks', type=int, default=60, help='User/model turns per chat')
+    parser.add_argument('--thought-ratio', type=float, default=0.5,
+                        help='Share of model turns preceded by a thought chunk')
+    parser.add_argument('--text-size', type=int, default=1500, help='Average characters per chunk')
+    parser.add_argument('--parts-ratio', type=float, default=0.5,
+                        help='Share of model turns that also carry a parts array')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic corpus')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for the batch run (default: CPU count)')
+    parser.add_argument('--compact', action='store_true', help='Benchmark compact output')
+    parser.add_argument('--history-only', action='store_true',
+                        help='Benchmark output without the chat.messages copy')
+    parser.add_argument('--json-backend', choices=('auto', 'orjson', 'ujson', 'json'), default='auto',
+                        help='JSON library to benchmark (default: fastest installed)')
+    parser.add_argument('--input', default=None,
+                        help='Benchmark an existing export directory instead of generating one')
+    parser.add_argument('--keep', default=None, metavar='DIR',
+                        help='Keep the generated corpus and outputs in this directory')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix='aistudio-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        input_dir = args.input or os.path.join(work_dir, 'input')
+        if args.input is None:
+            generate_corpus(input_dir, files=args.files, seed=args.seed, chunks=args.chunks,
+                            thought_ratio=args.thought_ratio, text_size=args.text_size,
+                            parts_ratio=args.parts_ratio)
+        input_bytes = sum(entry.stat().st_size for entry in os.scandir(input_dir) if entry.is_file())
+        file_count = sum(1 for entry in os.scandir(input_dir) if entry.is_file())
+
+        timings = measure_phases(input_dir, os.path.join(work_dir, 'phases'), compact=args.compact,
+                                 json_backend=args.json_backend, history_only=args.history_only)
+        elapsed, chats = measure_batch(input_dir, os.path.join(work_dir, 'batch'),
+                                       workers=args.workers, compact=args.compact,
+                                       json_backend=args.json_backend, history_only=args.history_only)
+
+        results = {
+            "files": file_count,
+            "input_mb": input_bytes / (1024 * 1024),
+            "workers": args.workers or os.cpu_count() or 1,
+            "json_backend": converter.get_json_backend(args.json_backend).name,
+            "phases": timings,
+            "batch_seconds": elapsed,
+            "chats_per_second": chats / elapsed if elapsed else 0.0,
+            "mb_per_second": input_bytes / (1024 * 1024) / elapsed if elapsed else 0.0,
+            # Sampled after the batch run, which converts in this process
+            # with one worker
+            "peak_rss_mb": _peak_rss_mb(),
+            "peak_worker_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN)
+        }
+    finally:
+        if args.keep is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    total = sum(timings.values())
+    print(f"Corpus: {results['files']} files, {results['input_mb']:.1f} MB "
+          f"(JSON backend: {results['json_backend']})")
+    print("Per-phase timings (single process):")
+    for phase in PHASES:
+        share = timings[phase] / total * 100 if total else 0.0
+        print(f"  {phase:<10} {timings[phase]:8.3f} s  {share:5.1f}%")
+    print(f"Batch run (workers={results['workers']}): {elapsed:.3f} s, "
+          f"{results['chats_per_second']:.1f} chats/s, {results['mb_per_second']:.1f} MB/s")
+    print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB (main), "
+          f"{results['peak_worker_rss_mb']:.1f} MB (largest worker)")
+
+if __name__ == "__main__":
+    main()
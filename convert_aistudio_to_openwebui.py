@@ -1,46 +1,286 @@
 import json
 import os
+import re
 import uuid
 from datetime import datetime
 import argparse
+import base64
+import concurrent.futures
+import cProfile
+import fnmatch
+import gzip
+import hashlib
+import http.client
+import io
+import itertools
+import mimetypes
+import pstats
+import queue
+import random
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.parse
+import zipfile
+from collections import deque, namedtuple
+from contextlib import contextmanager, nullcontext
 
-def convert_aistudio_to_openwebui(aistudio_data, filename=None):
+# Optional faster JSON libraries
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Optional zstd compression of outputs
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Optional sampling profiler for --profile
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Read size for streaming AIStudio input
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Characters that may continue a JSON number
+_NUMBER_CHARS = re.compile(r'[-+0-9.eE]*')
+
+# Inputs up to this size are parsed in one go with the JSON backend;
+# larger ones are streamed chunk by chunk
+WHOLE_FILE_MAX_BYTES = 16 * 1024 * 1024
+
+# Serialized chat.messages copies are kept in memory up to this size
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Read size for content hashing
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Batch tasks in flight per worker process, and finished results held
+# back per worker while an earlier, slower task is still running
+TASKS_PER_WORKER = 4
+RESULTS_PER_WORKER = 64
+
+# Batch manifest of converted inputs, kept in the output directory
+MANIFEST_NAME = ".aistudio_manifest.json"
+MANIFEST_VERSION = 1
+
+# Namespace for deterministic (UUIDv5) chat and message IDs
+ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://github.com/chromaticsequence/aistudio_to_openwebui_migration")
+
+# Base name of the combined import file written in bundle mode
+BUNDLE_NAME = "openwebui_import"
+
+# Columns written to OpenWebUI's chat table, when present in the schema
+SQLITE_CHAT_COLUMNS = ("id", "user_id", "title", "chat", "created_at", "updated_at",
+                       "share_id", "archived", "pinned", "meta", "folder_id")
+
+# Rows per transaction, and serialized chat bytes per transaction, when
+# inserting into an OpenWebUI database
+SQLITE_BATCH_ROWS = 2000
+SQLITE_BATCH_BYTES = 64 * 1024 * 1024
+
+# Schema of the --catalog database: one row per converted input file
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    source TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    chat_id TEXT,
+    title TEXT,
+    model TEXT,
+    messages INTEGER NOT NULL,
+    user_messages INTEGER NOT NULL,
+    assistant_messages INTEGER NOT NULL,
+    thoughts INTEGER NOT NULL,
+    bytes_in INTEGER NOT NULL,
+    bytes_out INTEGER,
+    modified_at INTEGER NOT NULL,
+    converted_at INTEGER NOT NULL,
+    output TEXT
+);
+CREATE INDEX IF NOT EXISTS chats_model ON chats (model, modified_at);
+CREATE INDEX IF NOT EXISTS chats_messages ON chats (messages);
+CREATE INDEX IF NOT EXISTS chats_modified_at ON chats (modified_at);
+CREATE INDEX IF NOT EXISTS chats_sha256 ON chats (sha256);
+CREATE INDEX IF NOT EXISTS chats_chat_id ON chats (chat_id);
+"""
+CATALOG_COLUMNS = ("source", "sha256", "chat_id", "title", "model", "messages", "user_messages",
+                   "assistant_messages", "thoughts", "bytes_in", "bytes_out", "modified_at",
+                   "converted_at", "output")
+
+# Schema of the --search-index database: an FTS5 table of message text plus
+# the row range each chat occupies in it, so reconverted chats are replaced
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    source TEXT UNIQUE,
+    title TEXT,
+    first_rowid INTEGER NOT NULL,
+    last_rowid INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    content, reasoning, role UNINDEXED, chat_id UNINDEXED, message_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Index pages FTS5 may merge when a --search-index run ends; segments are
+# merged incrementally as rows are added, and a full 'optimize' would
+# rewrite the whole index after every run, however few chats it added
+SEARCH_MERGE_PAGES = 1000
+
+# OpenWebUI chat import endpoint, relative to the instance's base URL
+API_IMPORT_PATH = "/api/v1/chats/import"
+
+# Upload defaults: parallel requests, retries of transient failures, base
+# backoff delay and per-request timeout in seconds
+API_CONCURRENCY = 4
+API_MAX_RETRIES = 5
+API_BACKOFF = 1.0
+API_TIMEOUT = 120
+
+# Append-only record of completed uploads, kept in the output directory
+UPLOAD_CHECKPOINT_NAME = ".aistudio_upload_checkpoint.jsonl"
+
+# Append-only record of the inputs completed by a batch run, kept in the
+# output directory until the run finishes so that an interrupted run can
+# be resumed
+JOURNAL_NAME = ".aistudio_journal.jsonl"
+
+# Seconds between journal writes, which are synced to disk in one go for
+# all inputs finished since the last one; SQLite databases first commit
+# their queued rows, and the journal is also written whenever a database
+# commits a full batch
+JOURNAL_INTERVAL = 5.0
+
+# Chunk and part keys carrying base64 attachments in AIStudio exports
+INLINE_DATA_KEYS = ("inlineImage", "inlineData")
+
+# Base64 characters decoded per step when extracting attachments (a
+# multiple of 4, so every slice decodes on its own)
+BLOB_DECODE_BLOCK = 4 * 256 * 1024
+
+# Chunk and part keys referencing files on Google Drive
+DRIVE_REF_KEYS = ("driveDocument", "driveImage")
+
+# Index of Drive file IDs in a Takeout tree, kept between runs
+DRIVE_INDEX_NAME = ".aistudio_drive_index.json"
+DRIVE_INDEX_VERSION = 1
+
+# Drive file IDs embedded in Takeout file names, and the largest JSON
+# sidecar read for an explicit ID while indexing
+_DRIVE_ID = re.compile(r'[A-Za-z0-9_-]{25,}')
+DRIVE_SIDECAR_MAX_BYTES = 64 * 1024
+
+# Archive formats read directly in batch mode
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tgz", ".tar.gz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# File name suffixes and default levels of the output compressors
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+COMPRESSION_LEVELS = {"gzip": 6, "zstd": 3}
+
+# Bytes read from the start of each batch input to recognize AIStudio
+# prompts, and top-level keys that identify one (runSettings comes first)
+SNIFF_BYTES = 4096
+AISTUDIO_KEYS = (b'"runSettings"', b'"systemInstruction"', b'"chunkedPrompt"')
+
+# Chunk fields that make up a conversation for --dedup; the rest (token
+# counts, finish reasons, ...) doesn't show up in the converted chat
+DEDUP_CHUNK_KEYS = ("role", "text", "isThought", "parts") + INLINE_DATA_KEYS + DRIVE_REF_KEYS
+
+# MinHash signature length (a power of two), LSH bands, words per shingle
+# and default similarity for --near-dups report and --near-dups best (which
+# skips conversions, so only close edits count), and the cluster report
+NEAR_DUP_PERMUTATIONS = 128
+NEAR_DUP_BANDS = 42
+NEAR_DUP_SHINGLE_WORDS = 5
+NEAR_DUP_THRESHOLD = 0.5
+NEAR_DUP_BEST_THRESHOLD = 0.8
+NEAR_DUP_REPORT_NAME = "aistudio_near_duplicates.json"
+
+# Leading chunks, thoughts not counted, that prompts must share to be
+# merged into one branched chat by --merge-branches: the first two
+# questions and answers, since a single greeting exchange is common to
+# unrelated chats
+MERGE_PREFIX_CHUNKS = 4
+# Odd 64-bit multiplier of the rolling shingle hash (golden ratio)
+_SHINGLE_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Write buffer of the JSONL results log
+RESULTS_LOG_BUFFER = 1024 * 1024
+
+# Default --profile output and the pipeline phases it breaks time down into
+PROFILE_NAME = "aistudio_convert.prof"
+PROFILE_PHASES = ("read", "parse", "convert", "serialize", "write")
+
+# Seconds per phase measured by _convert_file, added up over the inputs
+# converted in this process (see record_phase_timings)
+_phase_seconds = dict.fromkeys(PROFILE_PHASES, 0.0)
+
+# Sentinel for exhausted iterators
+_MISSING = object()
+
+def _id_generator(id_seed=None):
     """
-    Convert AIStudio chat format to OpenWebUI chat format
+    Return a function mapping a key within one chat to an ID string
     
-    Args:
-        aistudio_data (dict): Parsed AIStudio JSON data
-        filename (str): Original filename for title
-        
-    Returns:
-        list: OpenWebUI formatted chat data
+    Without a seed every call returns a fresh random UUID. With a seed
+    (normally a hash of the input's name and content) IDs are UUIDv5 values
+    derived from the seed and key, so reconverting the same input always
+    yields the same chat and message IDs.
     """
-    # Extract conversation chunks
-    chunks = aistudio_data.get("chunkedPrompt", {}).get("chunks", [])
-    
-    if not chunks:
-        return []
-    
-    # Generate chat ID and user ID
-    chat_id = str(uuid.uuid4())
-    user_id = str(uuid.uuid4())
-    
-    # Create message dictionary
-    messages = {}
-    messages_list = []
+    if id_seed is None:
+        return lambda key: str(uuid.uuid4())
+    return lambda key: str(uuid.uuid5(ID_NAMESPACE, f"{id_seed}:{key}"))
+
+def _reasoning_section(thoughts):
+    """Collapsible details block that embeds thought texts in a response"""
+    combined_thoughts = "\n\n".join(thoughts)
+    return f'<details type="reasoning" done="true" duration="5">\n<summary>Thought for 5 seconds</summary>\n{combined_thoughts}\n</details>\n\n'
+
+def _iter_messages(chunks, model, base_timestamp, new_id, blob_store=None, drive_files=None,
+                   thoughts=None):
+    """
+    Convert AIStudio chunks into a linear chain of OpenWebUI messages
     
-    # Track parent ID for building conversation chain
-    parent_id = None
+    Messages are yielded lazily, each one as soon as its successor is known,
+    so childrenIds is already final when a message is handed out.
     
-    # Generate base timestamp (using current time)
-    base_timestamp = int(datetime.now().timestamp())
+    Args:
+        chunks (iterable): AIStudio chunks in conversation order
+        model (str): Model name recorded on assistant messages
+        base_timestamp (int): Timestamp of the first message
+        new_id (callable): ID generator from _id_generator, called with
+            the chunk index
+        blob_store (BlobStore): Where to extract inline images; without one
+            they are dropped
+        drive_files (DriveFiles): Resolves Drive document and image
+            references; without one they are dropped
+        thoughts (dict): If given, the thought texts folded into an
+            assistant message are stored here under its ID just before the
+            message is yielded (consumers should pop them)
+    """
+    # Track previous message for building conversation chain
+    previous = None
     
     # Keep track of pending thoughts
     pending_thoughts = []
     
     # Process each chunk in order to maintain sequence
     message_index = 0
-    for i, chunk in enumerate(chunks):
+    for chunk_index, chunk in enumerate(chunks):
         # Check if this is a thought chunk
         if chunk.get("isThought", False):
             # Collect thought content
@@ -59,7 +299,7 @@ def convert_aistudio_to_openwebui(aistudio_data, filename=None):
         
         # This is a regular chunk (user or model response)
         # Generate message ID
-        message_id = str(uuid.uuid4())
+        message_id = new_id(chunk_index)
         
         # Determine role
         role = "user" if chunk.get("role") == "user" else "assistant"
@@ -69,68 +309,124 @@ def convert_aistudio_to_openwebui(aistudio_data, filename=None):
         
         # If this is a model response and we have pending thoughts, prepend them
         if role == "assistant" and pending_thoughts:
-            # Combine all pending thoughts
-            combined_thoughts = "\n\n".join(pending_thoughts)
-            # Format as details tag
-            thought_section = f'<details type="reasoning" done="true" duration="5">\n<summary>Thought for 5 seconds</summary>\n{combined_thoughts}\n</details>\n\n'
-            content = thought_section + content
+            if thoughts is not None:
+                thoughts[message_id] = pending_thoughts
+            # Combine all pending thoughts into a details tag
+            content = _reasoning_section(pending_thoughts) + content
             # Clear pending thoughts
             pending_thoughts = []
         
         # Create message object with sequential timestamps
         message = {
             "id": message_id,
-            "parentId": parent_id,
+            "parentId": previous["id"] if previous else None,
             "childrenIds": [],
             "role": role,
             "content": content,
             "timestamp": base_timestamp + message_index
         }
         
+        # Attach inline images, stored outside the chat JSON, and Drive files
+        files = []
+        if blob_store is not None:
+            files.extend(blob_store.extract(chunk))
+        if drive_files is not None:
+            files.extend(drive_files.resolve(chunk))
+        if files:
+            message["files"] = files
+        
         # Add model information for assistant messages
         if role == "assistant":
-            message["model"] = aistudio_data.get("runSettings", {}).get("model", "unknown")
+            message["model"] = model
             message["modelName"] = "Converted from AIStudio"
             message["modelIdx"] = 0
             message["done"] = True
         
-        # Add to messages dictionary
-        messages[message_id] = message
+        # Link to the previous message, which is now complete
+        if previous is not None:
+            previous["childrenIds"].append(message_id)
+            yield previous
         
-        # Add to messages list
-        messages_list.append(message)
-        
-        # Update parent ID for next iteration
-        if parent_id and parent_id in messages:
-            messages[parent_id]["childrenIds"].append(message_id)
-        
-        parent_id = message_id
+        previous = message
         message_index += 1
     
+    if previous is not None:
+        yield previous
+
+def convert_aistudio_stream(aistudio_data, filename=None, id_seed=None, blob_store=None,
+                            drive_files=None, thoughts=None):
+    """
+    Incrementally convert AIStudio chat format to OpenWebUI chat format
+    
+    Args:
+        aistudio_data (dict): Parsed AIStudio JSON data; chunkedPrompt.chunks
+            may be any iterable, such as the one from read_aistudio_stream
+        filename (str): Original filename for title
+        id_seed (str): Derive deterministic IDs from this seed (such as
+            the input's content hash) instead of random UUIDs
+        blob_store (BlobStore): Extract inline images into this store and
+            reference them from the messages' files
+        drive_files (DriveFiles): Attach the local copies of referenced
+            Drive documents and images
+        thoughts (dict): Receives the thought texts behind each assistant
+            message's reasoning section, see _iter_messages
+        
+    Returns:
+        tuple: (chat, messages) where chat is the OpenWebUI chat structure
+        with empty history and message list, and messages lazily yields the
+        message dicts in order; None if there is nothing to convert
+    """
+    # Extract conversation chunks (a list, or a lazy iterator when streaming)
+    chunks = iter(aistudio_data.get("chunkedPrompt", {}).get("chunks", []))
+    
+    # Nothing to convert
+    first_chunk = next(chunks, _MISSING)
+    if first_chunk is _MISSING:
+        return None
+    chunks = itertools.chain([first_chunk], chunks)
+    
+    # Generate chat ID and user ID
+    new_id = _id_generator(id_seed)
+    chat_id = new_id("chat")
+    user_id = new_id("user")
+    
+    # Generate base timestamp (using current time)
+    base_timestamp = int(datetime.now().timestamp())
+    
+    model = aistudio_data.get("runSettings", {}).get("model", "unknown")
+    messages = _iter_messages(chunks, model, base_timestamp, new_id, blob_store, drive_files, thoughts)
+    
     # Determine chat title (use filename or first user message)
     if filename:
         # Remove path and extension for cleaner title
         title = os.path.splitext(os.path.basename(filename))[0]
     else:
         title = "AIStudio Conversation"
-        if messages_list and messages_list[0]["role"] == "user":
-            title = messages_list[0]["content"][:50] + "..." if len(messages_list[0]["content"]) > 50 else messages_list[0]["content"]
+        first_message = next(messages, None)
+        if first_message is not None:
+            messages = itertools.chain([first_message], messages)
+            if first_message["role"] == "user":
+                title = first_message["content"][:50] + "..." if len(first_message["content"]) > 50 else first_message["content"]
     
     # Create the OpenWebUI chat structure
-    openwebui_chat = {
+    return _new_chat(chat_id, user_id, title, model, base_timestamp), messages
+
+def _new_chat(chat_id, user_id, title, model, base_timestamp):
+    """OpenWebUI chat structure with an empty history and message list"""
+    return {
         "id": chat_id,
         "user_id": user_id,
         "title": title,
         "chat": {
             "id": "",
             "title": title,
-            "models": [aistudio_data.get("runSettings", {}).get("model", "unknown")],
+            "models": [model],
             "params": {},
             "history": {
-                "messages": messages,
-                "currentId": parent_id  # Last message ID
+                "messages": {},
+                "currentId": None  # Last message ID
             },
-            "messages": messages_list,
+            "messages": [],
             "tags": [],
             "timestamp": base_timestamp,
             "files": []
@@ -143,91 +439,3367 @@ def convert_aistudio_to_openwebui(aistudio_data, filename=None):
             "tags": ["aistudio", "converted"]
         }
     }
+
+def convert_aistudio_branches(prompts, filename=None, id_seed=None, blob_store=None, drive_files=None,
+                              thoughts=None):
+    """
+    Merge AIStudio prompts that share leading chunks into one branched chat
     
-    return [openwebui_chat]
+    The prompts' chunks are inserted into a trie keyed on chunk digests
+    (see _chunk_digest), so chunks shared by several prompts become a single
+    chain of nodes and the chunks where they diverge become siblings. Each
+    prompt is then converted like a single one, with message IDs taken from
+    its trie nodes, and the messages are merged: a shared message appears
+    once, with every continuation in its childrenIds. The prompt with the
+    most messages (the first one on a tie) becomes the current branch.
+    
+    Args:
+        prompts (list): Parsed AIStudio data of each variant, in order
+        filename (str): Original filename of the first variant, for the title
+        id_seed (str): Derive deterministic IDs from this seed
+        blob_store (BlobStore): See convert_aistudio_stream
+        drive_files (DriveFiles): See convert_aistudio_stream
+        thoughts (dict): See convert_aistudio_stream
+        
+    Returns:
+        tuple: (chat, messages) as from convert_aistudio_stream, except that
+        chat.messages already holds the current branch and
+        history.currentId its last message; None if there is nothing to
+        convert
+    """
+    new_id = _id_generator(id_seed)
+    
+    # Insert every prompt into the trie; a node is (children, serial number)
+    trie = {}
+    serials = itertools.count()
+    variants = []
+    for aistudio_data in prompts:
+        chunks = list(aistudio_data.get("chunkedPrompt", {}).get("chunks", []))
+        children = trie
+        path = []
+        for chunk in chunks:
+            digest = _chunk_digest(chunk)
+            node = children.get(digest)
+            if node is None:
+                node = children[digest] = ({}, next(serials))
+            path.append(node[1])
+            children = node[0]
+        variants.append((aistudio_data, chunks, path))
+    
+    node_ids = {}
+    def node_id(serial):
+        if serial not in node_ids:
+            node_ids[serial] = new_id(serial)
+        return node_ids[serial]
+    
+    # Convert each variant along its trie path and merge the messages
+    base_timestamp = int(datetime.now().timestamp())
+    messages = {}
+    branch = []
+    for aistudio_data, chunks, path in variants:
+        model = aistudio_data.get("runSettings", {}).get("model", "unknown")
+        variant_messages = []
+        for message in _iter_messages(chunks, model, base_timestamp, lambda index, path=path: node_id(path[index]),
+                                      blob_store, drive_files, thoughts):
+            merged = messages.setdefault(message["id"], message)
+            for child_id in message["childrenIds"]:
+                if child_id not in merged["childrenIds"]:
+                    merged["childrenIds"].append(child_id)
+            variant_messages.append(merged)
+        if len(variant_messages) > len(branch):
+            branch = variant_messages
+    if not messages:
+        return None
+    
+    title = os.path.splitext(os.path.basename(filename))[0] if filename else "AIStudio Conversation"
+    model = prompts[0].get("runSettings", {}).get("model", "unknown")
+    openwebui_chat = _new_chat(new_id("chat"), new_id("user"), title, model, base_timestamp)
+    openwebui_chat["chat"]["messages"] = branch
+    openwebui_chat["chat"]["history"]["currentId"] = branch[-1]["id"]
+    return openwebui_chat, iter(messages.values())
 
-def process_file(input_path, output_path):
+def convert_aistudio_to_openwebui(aistudio_data, filename=None, id_seed=None, blob_store=None,
+                                  drive_files=None, history_only=False):
     """
-    Process a single AIStudio file and convert it to OpenWebUI format
+    Convert AIStudio chat format to OpenWebUI chat format
     
     Args:
-        input_path (str): Path to input AIStudio file
-        output_path (str): Path to output OpenWebUI JSON file
+        aistudio_data (dict): Parsed AIStudio JSON data
+        filename (str): Original filename for title
+        id_seed (str): Derive deterministic IDs from this seed (such as
+            the input's content hash) instead of random UUIDs
+        blob_store (BlobStore): Extract inline images into this store and
+            reference them from the messages' files
+        drive_files (DriveFiles): Attach the local copies of referenced
+            Drive documents and images
+        history_only (bool): Keep the messages only in chat.history (which
+            is what OpenWebUI reads) and leave chat.messages empty
+        
+    Returns:
+        list: OpenWebUI formatted chat data
     """
+    converted = convert_aistudio_stream(aistudio_data, filename, id_seed, blob_store, drive_files)
+    if converted is None:
+        return []
+    
+    openwebui_chat, message_iter = converted
+    
+    # Collect messages both by ID and in order
+    messages = {}
+    messages_list = []
+    for message in message_iter:
+        messages[message["id"]] = message
+        messages_list.append(message)
+    
+    history = openwebui_chat["chat"]["history"]
+    history["messages"] = messages
+    history["currentId"] = messages_list[-1]["id"] if messages_list else None
+    if not history_only:
+        openwebui_chat["chat"]["messages"] = messages_list
+    
+    return [openwebui_chat]
+
+def _json_options(compact=False):
+    """Keyword arguments for json.dumps in the default or compact layout"""
+    if compact:
+        return {"ensure_ascii": False, "separators": (',', ':')}
+    return {"ensure_ascii": False, "indent": 2}
+
+# A JSON implementation: loads accepts bytes or str, dumps(obj, options)
+# takes _json_options keyword arguments and returns str
+JSONBackend = namedtuple("JSONBackend", "name loads dumps")
+
+def _stdlib_dumps(obj, options):
+    return json.dumps(obj, **options)
+
+def _orjson_dumps(obj, options):
+    indent = options.get("indent")
+    if indent not in (None, 2):
+        return json.dumps(obj, **options)
     try:
-        # Read AIStudio file
-        with open(input_path, 'r', encoding='utf-8') as f:
-            aistudio_data = json.load(f)
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+    except TypeError:
+        # Integers beyond 64 bits, lone surrogates and the like
+        return json.dumps(obj, **options)
+
+def _ujson_dumps(obj, options):
+    try:
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False,
+                           indent=options.get("indent") or 0)
+    except (OverflowError, TypeError, ValueError):
+        return json.dumps(obj, **options)
+
+def get_json_backend(name="auto"):
+    """
+    Select the JSON implementation used for parsing and serialization
+    
+    All backends produce the same JSON layout as the stdlib json module;
+    the faster ones fall back to it for values they cannot encode.
+    
+    Args:
+        name (str): "orjson", "ujson", "json", or "auto" for the fastest
+            one installed
+        
+    Returns:
+        JSONBackend: The selected backend
+    """
+    if name == "auto":
+        name = "orjson" if orjson is not None else "ujson" if ujson is not None else "json"
+    if name == "orjson":
+        if orjson is None:
+            raise ValueError("JSON backend 'orjson' is not installed")
+        return JSONBackend("orjson", orjson.loads, _orjson_dumps)
+    if name == "ujson":
+        if ujson is None:
+            raise ValueError("JSON backend 'ujson' is not installed")
+        return JSONBackend("ujson", ujson.loads, _ujson_dumps)
+    if name == "json":
+        return JSONBackend("json", json.loads, _stdlib_dumps)
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+def _template_slot(text, marker, indent):
+    """
+    Locate a placeholder in a serialized template
+    
+    Returns:
+        tuple: (start, end, child_pad, close_pad) where the pads are the line
+        breaks and indentation for the placeholder's children and closing
+        bracket ('' in compact output)
+    """
+    start = text.index(marker)
+    end = start + len(marker)
+    if indent is None:
+        return start, end, '', ''
+    line = text[text.rfind('\n', 0, start) + 1:start]
+    key_pad = line[:len(line) - len(line.lstrip(' '))]
+    return start, end, '\n' + key_pad + ' ' * indent, '\n' + key_pad
+
+def _list_layout(options):
+    """
+    Opening, item separator and closing text of a top-level JSON array
+    
+    Returns:
+        tuple: (open, separator, close) such that elements serialized at
+        nesting level 1 can be joined into the array by hand
+    """
+    indent = options.get("indent")
+    item_separator = options.get("separators", (',', ': '))[0]
+    if indent is None:
+        return '[', item_separator, ']'
+    pad = '\n' + ' ' * indent
+    return '[' + pad, item_separator + pad, '\n]'
+
+def _write_chat_element(f, converted, options, chat_only=False, backend=None, history_only=False):
+    """
+    Stream one converted chat as an element of a top-level JSON array
+    
+    Each message is serialized once, written straight to f for
+    history.messages and to a spool file for the chat.messages copy, which
+    is appended afterwards, so the full message list is never held in
+    memory. With history_only the copy is left out and chat.messages is
+    written as an empty list.
+    
+    Branched chats (see convert_aistudio_branches) arrive with
+    history.currentId and the messages of that branch in chat.messages
+    already set; those are kept instead of treating the last message as
+    current and copying every message.
+    
+    Args:
+        f (file): Text file object to write to
+        converted (tuple): (chat, messages) from convert_aistudio_stream
+        options (dict): Keyword arguments for json.dumps
+        chat_only (bool): Write just the inner "chat" object as a standalone
+            document, as stored in OpenWebUI's chat table
+        backend (JSONBackend): Serializer for messages (default: stdlib)
+        history_only (bool): Don't repeat the messages in chat.messages
+    """
+    dumps = (backend or get_json_backend("json")).dumps
+    indent = options.get("indent")
+    item_separator, key_separator = options.get("separators", (',', ': '))
+    list_open, _, list_end = _list_layout(options)
+    
+    openwebui_chat, messages = converted
+    
+    # Serialize the chat around placeholders for the streamed parts
+    chat = openwebui_chat["chat"]
+    branch = chat["messages"]
+    branch_current_id = chat["history"]["currentId"]
+    chat["history"]["messages"] = "\x00history\x00"
+    chat["history"]["currentId"] = "\x00current\x00"
+    chat["messages"] = "\x00list\x00"
+    if chat_only:
+        template = json.dumps(chat, **options)
+    else:
+        template = json.dumps([openwebui_chat], **options)
+        template = template[len(list_open):-len(list_end)]
+    
+    history_start, history_end, history_pad, history_close = _template_slot(
+        template, json.dumps(chat["history"]["messages"]), indent)
+    current_start, current_end, _, _ = _template_slot(
+        template, json.dumps(chat["history"]["currentId"]), indent)
+    list_start, list_end, list_pad, list_close = _template_slot(
+        template, json.dumps(chat["messages"]), indent)
+    
+    current_id = None
+    spool_file = nullcontext() if history_only or branch else \
+        tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', encoding='utf-8')
+    with spool_file as spool:
+        f.write(template[:history_start] + '{')
+        separator = ''
+        for message in messages:
+            text = dumps(message, options)
+            f.write(f"{separator}{history_pad}{json.dumps(message['id'])}{key_separator}"
+                    f"{text.replace(chr(10), history_pad)}")
+            if spool is not None:
+                spool.write(f"{separator}{list_pad}{text.replace(chr(10), list_pad)}")
+            separator = item_separator
+            current_id = message["id"]
+        
+        if branch:
+            current_id = branch_current_id
+        if current_id is None:
+            history_close = list_close = ''
+        f.write(history_close + '}')
+        f.write(template[history_end:current_start])
+        f.write(json.dumps(current_id))
+        f.write(template[current_end:list_start] + '[')
+        if spool is not None:
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+            f.write(list_close)
+        elif branch and not history_only:
+            f.write(item_separator.join(list_pad + dumps(message, options).replace(chr(10), list_pad)
+                                        for message in branch))
+            f.write(list_close)
+        f.write(']')
+        f.write(template[list_end:])
+
+def write_openwebui_json(f, converted, compact=False, backend=None, history_only=False):
+    """
+    Write the output of convert_aistudio_stream as messages are produced
+    
+    The default layout is byte-for-byte what json.dump(...,
+    ensure_ascii=False, indent=2) produces for convert_aistudio_to_openwebui.
+    
+    Args:
+        f (file): Text file object to write to
+        converted (tuple): (chat, messages) from convert_aistudio_stream, or None
+        compact (bool): Use compact separators and no indentation
+        backend (JSONBackend): Serializer for messages (default: stdlib)
+        history_only (bool): Leave chat.messages empty, see _write_chat_element
+    """
+    options = _json_options(compact)
+    
+    if converted is None:
+        f.write(json.dumps([], **options))
+        return
+    
+    list_open, _, list_close = _list_layout(options)
+    f.write(list_open)
+    _write_chat_element(f, converted, options, backend=backend, history_only=history_only)
+    f.write(list_close)
+
+def open_output(path, compression=None, level=None, threads=0):
+    """
+    Open an output file for binary writing, optionally compressing it
+    
+    Data is compressed as it is written, so compressed output costs no
+    extra memory or disk space.
+    
+    Args:
+        path (str): File to create
+        compression (str): None, "gzip" or "zstd"
+        level (int): Compression level (default: COMPRESSION_LEVELS)
+        threads (int): zstd worker threads (0 compresses in the calling
+            thread, -1 uses one per CPU)
+        
+    Returns:
+        file: Writable binary file object
+    """
+    if compression is None:
+        return open(path, 'wb')
+    if level is None:
+        level = COMPRESSION_LEVELS[compression]
+    if compression == "gzip":
+        # A fixed header timestamp keeps the output reproducible
+        return gzip.GzipFile(path, 'wb', compresslevel=level, mtime=0)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+        return compressor.stream_writer(open(path, 'wb'), closefd=True)
+    raise ValueError(f"Unknown compression: {compression}")
+
+def _replace_durably(temp_path, path):
+    """
+    Rename a finished temporary file over path once it is on disk
+    
+    The file's data is synced before the rename and the directory entry
+    after it, so that after a power loss or OS crash path holds either its
+    old contents or the complete new ones, never an empty or partial file.
+    """
+    with open(temp_path, 'ab') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    if os.name == 'posix':
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+class BundleWriter:
+    """
+    Incrementally join converted chats into OpenWebUI import files
+    
+    Chats are appended one at a time as pre-serialized array elements, so
+    a bundle of any size is written without holding it in memory. With
+    max_size set, a new numbered shard is started whenever the next chat
+    would push the current one over the limit; a chat larger than the
+    limit gets a shard of its own. Sizes are measured before compression.
+    Each shard is written under a temporary name and renamed into place
+    when it is finished. Closing the writer removes bundle files with the
+    same name left in output_dir by earlier runs, so the files present
+    afterwards are exactly the ones this run wrote.
+    """
+    
+    def __init__(self, output_dir, compact=False, max_size=None, name=BUNDLE_NAME,
+                 compression=None, compress_level=None, compress_threads=0):
+        self.output_dir = output_dir
+        self.max_size = max_size
+        self.name = name
+        self.compression = compression
+        self.compress_level = compress_level
+        self.compress_threads = compress_threads
+        self.paths = []
+        self.chat_count = 0
+        list_open, separator, list_close = _list_layout(_json_options(compact))
+        self._open = list_open.encode('utf-8')
+        self._separator = separator.encode('utf-8')
+        self._close = list_close.encode('utf-8')
+        self._empty = json.dumps([], **_json_options(compact)).encode('utf-8')
+        self._file = None
+        self._size = 0
+        self._shard_chats = 0
+    
+    def _shard_path(self, index):
+        suffix = ".json" + COMPRESSION_SUFFIXES.get(self.compression, "")
+        if self.max_size is None:
+            return os.path.join(self.output_dir, self.name + suffix)
+        return os.path.join(self.output_dir, f"{self.name}-{index:04d}{suffix}")
+    
+    def _start_shard(self):
+        path = self._shard_path(len(self.paths) + 1)
+        self._file = open_output(path + '.tmp', self.compression, self.compress_level, self.compress_threads)
+        self.paths.append(path)
+        self._size = 0
+        self._shard_chats = 0
+    
+    def _finish_shard(self):
+        self._file.write(self._close if self._shard_chats else self._empty)
+        self._file.close()
+        self._file = None
+        _replace_durably(self.paths[-1] + '.tmp', self.paths[-1])
+    
+    def add(self, element_path):
+        """
+        Append the chat serialized in element_path
         
-        # Get filename for title
-        filename = os.path.basename(input_path)
+        Args:
+            element_path (str): File holding one array element as written by
+                _write_chat_element (empty if there was nothing to convert)
+        """
+        element_size = os.path.getsize(element_path)
+        if not element_size:
+            return
         
-        # Convert to OpenWebUI format
-        openwebui_data = convert_aistudio_to_openwebui(aistudio_data, filename)
+        projected = self._size + len(self._separator) + element_size + len(self._close)
+        if self._file is not None and self.max_size is not None \
+                and self._shard_chats and projected > self.max_size:
+            self._finish_shard()
+        if self._file is None:
+            self._start_shard()
         
-        # Write to output file
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(openwebui_data, f, ensure_ascii=False, indent=2)
+        prefix = self._separator if self._shard_chats else self._open
+        self._file.write(prefix)
+        with open(element_path, 'rb') as element:
+            shutil.copyfileobj(element, self._file)
+        self._size += len(prefix) + element_size
+        self._shard_chats += 1
+        self.chat_count += 1
+    
+    def close(self):
+        """Finish the current shard (writing an empty bundle if nothing was added)"""
+        if self._file is None and not self.paths:
+            self._start_shard()
+        if self._file is not None:
+            self._finish_shard()
         
-        print(f"Successfully converted {input_path} to {output_path}")
-        return True
-    except Exception as e:
-        print(f"Error converting {input_path}: {str(e)}")
-        return False
+        # Remove bundles and shards from earlier runs, whatever their
+        # sharding or compression, so they can't be imported twice
+        stale = re.compile(re.escape(self.name) + r'(-\d{4})?\.json(\.gz|\.zst)?(\.tmp)?')
+        written = {os.path.basename(path) for path in self.paths}
+        for name in os.listdir(self.output_dir):
+            if stale.fullmatch(name) and name not in written:
+                os.remove(os.path.join(self.output_dir, name))
+    
+    def abort(self):
+        """Drop the unfinished shard, keeping the shards finished before it"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self.paths.pop() + '.tmp')
 
-def process_directory(input_dir, output_dir):
+class SQLiteChatWriter:
+    """
+    Bulk-insert converted chats into the chat table of an OpenWebUI database
+    
+    Rows are buffered and written with executemany, one transaction per
+    batch. Existing rows with the same chat ID are replaced, so re-running
+    an import with stable IDs updates chats instead of duplicating them.
+    chat_count is the number of distinct chats written; rows that replaced
+    a chat written earlier by the same writer are counted in
+    replaced_count instead. Only columns present in the target table are
+    written, which keeps older and newer OpenWebUI schemas working.
+    """
+    
+    def __init__(self, db_path, user_id, batch_rows=SQLITE_BATCH_ROWS, batch_bytes=SQLITE_BATCH_BYTES):
+        self.user_id = user_id
+        self.batch_rows = batch_rows
+        self.batch_bytes = batch_bytes
+        self.chat_count = 0
+        self.replaced_count = 0
+        self.commit_count = 0
+        self._chat_ids = set()
+        self._pending = []
+        self._pending_bytes = 0
+        
+        if not os.path.exists(db_path):
+            raise ValueError(f"OpenWebUI database not found: {db_path}")
+        self.connection = sqlite3.connect(db_path)
+        try:
+            table_columns = {row[1] for row in self.connection.execute("PRAGMA table_info(chat)")}
+            if not table_columns:
+                raise ValueError(f"{db_path} has no chat table; is it an OpenWebUI webui.db?")
+            missing = {"id", "user_id", "chat"} - table_columns
+            if missing:
+                raise ValueError(f"chat table in {db_path} lacks columns: {', '.join(sorted(missing))}")
+        except Exception:
+            self.connection.close()
+            raise
+        
+        self.columns = [column for column in SQLITE_CHAT_COLUMNS if column in table_columns]
+        self._sql = (f"INSERT OR REPLACE INTO chat ({', '.join(self.columns)}) "
+                     f"VALUES ({', '.join('?' * len(self.columns))})")
+    
+    def add(self, row):
+        """
+        Queue one chat row, flushing when the batch is full
+        
+        Args:
+            row (dict): Column values as built by _chat_row
+        """
+        row = dict(row, user_id=self.user_id)
+        self._pending.append(tuple(row.get(column) for column in self.columns))
+        self._pending_bytes += len(row["chat"])
+        if len(self._pending) >= self.batch_rows or self._pending_bytes >= self.batch_bytes:
+            self.flush()
+    
+    def flush(self):
+        """Write all queued rows in a single transaction"""
+        if not self._pending:
+            return
+        with self.connection:
+            self.connection.executemany(self._sql, self._pending)
+        id_index = self.columns.index("id")
+        for row in self._pending:
+            if row[id_index] in self._chat_ids:
+                self.replaced_count += 1
+            self._chat_ids.add(row[id_index])
+        self.chat_count = len(self._chat_ids)
+        self.commit_count += 1
+        self._pending = []
+        self._pending_bytes = 0
+    
+    def close(self):
+        """Flush queued rows and close the database"""
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+
+class CatalogWriter:
+    """
+    Record converted chats in an indexed SQLite catalog
+    
+    The catalog holds one row per input file with its hash, chat ID, title,
+    model, message and thought counts, sizes and modification time, so
+    the corpus can be queried without parsing any JSON. Rows are keyed by
+    source path and written in batched transactions; reconverting a file
+    replaces its row, and rows of files skipped as unchanged are kept.
+    """
+    
+    def __init__(self, db_path, batch_rows=SQLITE_BATCH_ROWS):
+        self.batch_rows = batch_rows
+        self.chat_count = 0
+        self.commit_count = 0
+        self._pending = []
+        self.connection = sqlite3.connect(db_path)
+        try:
+            self.connection.executescript(CATALOG_SCHEMA)
+        except Exception:
+            self.connection.close()
+            raise
+        self._sql = (f"INSERT OR REPLACE INTO chats ({', '.join(CATALOG_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})")
+    
+    def add(self, row):
+        """
+        Queue one catalog row, flushing when the batch is full
+        
+        Args:
+            row (dict): Values for CATALOG_COLUMNS
+        """
+        self._pending.append(tuple(row.get(column) for column in CATALOG_COLUMNS))
+        if len(self._pending) >= self.batch_rows:
+            self.flush()
+    
+    def flush(self):
+        """Write all queued rows in a single transaction"""
+        if not self._pending:
+            return
+        with self.connection:
+            self.connection.executemany(self._sql, self._pending)
+        self.chat_count += len(self._pending)
+        self.commit_count += 1
+        self._pending = []
+    
+    def close(self):
+        """Flush queued rows and close the catalog"""
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+
+class SearchIndexWriter:
+    """
+    Build a SQLite FTS5 full-text index of converted messages
+    
+    Every message becomes one row of the messages table, with the response
+    text and the model's reasoning (thought chunks) in separate columns so
+    they can be searched together or apart, e.g.
+    "messages MATCH 'reasoning: tokenizer'". Chat and message IDs are
+    stored alongside and the chats table maps them to titles and source
+    files. Messages are buffered and inserted in one transaction per batch.
+    Each chat occupies a contiguous rowid range, so reindexing a source file
+    removes its old messages without scanning the index. chat_count and
+    message_count cover the chats written by this writer that are still
+    in the index, not those replaced later on.
     """
-    Process all AIStudio files in a directory and convert them to OpenWebUI format
+    
+    def __init__(self, db_path, batch_rows=SQLITE_BATCH_ROWS, batch_bytes=SQLITE_BATCH_BYTES):
+        self.batch_rows = batch_rows
+        self.batch_bytes = batch_bytes
+        self.chat_count = 0
+        self.message_count = 0
+        self.replaced_count = 0
+        self.commit_count = 0
+        self._written = {}
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+        self.connection = sqlite3.connect(db_path)
+        try:
+            self.connection.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            self.connection.close()
+            raise ValueError(f"Cannot create search index {db_path} (SQLite needs FTS5): {e}")
+        except Exception:
+            self.connection.close()
+            raise
+        last_rowid = self.connection.execute("SELECT max(last_rowid) FROM chats").fetchone()[0]
+        self._next_rowid = (last_rowid or 0) + 1
+    
+    def add(self, source, chat_id, title, messages):
+        """
+        Queue one chat's messages, flushing when the batch is full
+        
+        Args:
+            source (str): Input file the chat came from; earlier entries for
+                it (or for chat_id) are replaced
+            chat_id (str): Converted chat ID
+            title (str): Chat title
+            messages (list): (message_id, role, content, reasoning) tuples
+        """
+        self._pending.append((source, chat_id, title, messages))
+        self._pending_rows += len(messages)
+        self._pending_bytes += sum(len(content) + len(reasoning or "")
+                                   for _, _, content, reasoning in messages)
+        if self._pending_rows >= self.batch_rows or self._pending_bytes >= self.batch_bytes:
+            self.flush()
+    
+    def flush(self):
+        """Write all queued chats in a single transaction"""
+        if not self._pending:
+            return
+        with self.connection:
+            for source, chat_id, title, messages in self._pending:
+                # Drop the previous version of this chat
+                for old_chat_id, first_rowid, last_rowid in self.connection.execute(
+                        "SELECT chat_id, first_rowid, last_rowid FROM chats WHERE source = ? OR chat_id = ?",
+                        (source, chat_id)).fetchall():
+                    self.connection.execute("DELETE FROM messages WHERE rowid BETWEEN ? AND ?",
+                                            (first_rowid, last_rowid))
+                    if old_chat_id in self._written:
+                        self.message_count -= self._written.pop(old_chat_id)
+                        self.replaced_count += 1
+                self.connection.execute("DELETE FROM chats WHERE source = ? OR chat_id = ?", (source, chat_id))
+                
+                first_rowid = self._next_rowid
+                self.connection.executemany(
+                    "INSERT INTO messages (rowid, content, reasoning, role, chat_id, message_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    ((first_rowid + i, content, reasoning, role, chat_id, message_id)
+                     for i, (message_id, role, content, reasoning) in enumerate(messages)))
+                self._next_rowid += len(messages)
+                self.connection.execute("INSERT INTO chats VALUES (?, ?, ?, ?, ?)",
+                                        (chat_id, source, title, first_rowid, self._next_rowid - 1))
+                self._written[chat_id] = len(messages)
+                self.message_count += len(messages)
+        self.chat_count = len(self._written)
+        self.commit_count += 1
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+    
+    def close(self):
+        """Flush queued chats, merge some index segments and close the database"""
+        try:
+            self.flush()
+            if self.commit_count:
+                with self.connection:
+                    self.connection.execute("INSERT INTO messages (messages, rank) VALUES ('merge', ?)",
+                                            (SEARCH_MERGE_PAGES,))
+        finally:
+            self.connection.close()
+
+def _chat_row(converted, backend=None, history_only=False):
+    """
+    Serialize a converted chat into a row for OpenWebUI's chat table
     
     Args:
-        input_dir (str): Path to directory containing AIStudio files
-        output_dir (str): Path to directory for output OpenWebUI JSON files
+        converted (tuple): (chat, messages) from convert_aistudio_stream
+        backend (JSONBackend): Serializer for messages (default: stdlib)
+        history_only (bool): Leave chat.messages empty
+        
+    Returns:
+        dict: Column values, with the chat and meta columns as JSON text
     """
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    openwebui_chat = converted[0]
+    buffer = io.StringIO()
+    _write_chat_element(buffer, converted, _json_options(compact=True), chat_only=True,
+                        backend=backend, history_only=history_only)
+    return {
+        "id": openwebui_chat["id"],
+        "user_id": openwebui_chat["user_id"],
+        "title": openwebui_chat["title"],
+        "chat": buffer.getvalue(),
+        "created_at": openwebui_chat["created_at"],
+        "updated_at": openwebui_chat["updated_at"],
+        "share_id": None,
+        "archived": openwebui_chat["archived"],
+        "pinned": openwebui_chat["pinned"],
+        "meta": json.dumps(openwebui_chat["meta"], ensure_ascii=False, separators=(',', ':')),
+        "folder_id": None
+    }
+
+def _import_body(row):
+    """
+    Build the request body for OpenWebUI's chat import endpoint
     
-    # Process all files in the input directory
-    success_count = 0
-    error_count = 0
+    The already-serialized chat and meta columns of a _chat_row are spliced
+    in as-is, so the chat is serialized exactly once.
     
-    for filename in os.listdir(input_dir):
-        # Process all files (AIStudio files don't necessarily have .json extension)
-        input_path = os.path.join(input_dir, filename)
+    Args:
+        row (dict): Chat row from _chat_row
         
-        # Skip directories
-        if os.path.isdir(input_path):
-            continue
+    Returns:
+        bytes: UTF-8 JSON body
+    """
+    fields = json.dumps({
+        "pinned": bool(row["pinned"]),
+        "folder_id": row["folder_id"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"]
+    }, separators=(',', ':'))
+    return f'{{"chat":{row["chat"]},"meta":{row["meta"]},{fields[1:]}'.encode('utf-8')
+
+class OpenWebUIUploader:
+    """
+    Upload converted chats to an OpenWebUI instance over its HTTP API
+    
+    Requests run on a bounded thread pool and every thread keeps its own
+    persistent keep-alive connection. Connection errors, 429 and 5xx
+    responses are retried with exponential backoff (honouring Retry-After)
+    by resending the same pre-encoded body.
+    """
+    
+    def __init__(self, base_url, api_key=None, concurrency=API_CONCURRENCY,
+                 max_retries=API_MAX_RETRIES, backoff=API_BACKOFF, timeout=API_TIMEOUT):
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise ValueError(f"Invalid OpenWebUI URL: {base_url}")
+        self._connection_class = (http.client.HTTPSConnection if url.scheme == 'https'
+                                  else http.client.HTTPConnection)
+        self._netloc = url.netloc
+        self._path = url.path.rstrip('/') + API_IMPORT_PATH
+        self._headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        if api_key:
+            self._headers["Authorization"] = f"Bearer {api_key}"
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='openwebui-upload')
+    
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connection_class(self._netloc, timeout=self.timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+    
+    def _reset_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+    
+    def upload(self, body):
+        """
+        POST one chat, retrying transient failures
+        
+        Args:
+            body (bytes): Request body from _import_body
             
-        # Determine output filename (always add .json extension)
-        if filename.endswith('.json'):
-            output_filename = filename
-        else:
-            output_filename = filename + '.json'
+        Returns:
+            dict: Decoded response from OpenWebUI (the created chat)
+        """
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                connection = self._connection()
+                connection.request('POST', self._path, body=body, headers=self._headers)
+                response = connection.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self._reset_connection()
+                if 200 <= response.status < 300:
+                    return json.loads(data) if data else {}
+                error = f"HTTP {response.status}: {data[:200].decode('utf-8', 'replace')}"
+                if response.status != 429 and response.status < 500:
+                    raise RuntimeError(error)
+                header = response.getheader('Retry-After')
+                if header and header.isdigit():
+                    retry_after = int(header)
+            except (OSError, http.client.HTTPException) as e:
+                self._reset_connection()
+                error = f"{type(e).__name__}: {e}"
             
-        output_path = os.path.join(output_dir, output_filename)
+            if attempt < self.max_retries:
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                time.sleep(retry_after if retry_after is not None else delay)
         
-        # Process the file
-        if process_file(input_path, output_path):
-            success_count += 1
-        else:
-            error_count += 1
+        raise RuntimeError(f"Upload failed after {self.max_retries + 1} attempts: {error}")
     
-    print(f"Conversion complete: {success_count} successful, {error_count} errors")
+    def submit(self, body):
+        """Queue an upload and return a Future for its response"""
+        return self._executor.submit(self.upload, body)
+    
+    def close(self):
+        """Wait for queued uploads and close all connections"""
+        self._executor.shutdown(wait=True)
+        for connection in self._connections:
+            connection.close()
 
-def main():
-    parser = argparse.ArgumentParser(description='Convert AIStudio chat files to OpenWebUI format')
-    parser.add_argument('input', help='Input file or directory path')
-    parser.add_argument('output', help='Output file or directory path')
-    parser.add_argument('--batch', action='store_true', help='Process multiple files in batch mode')
+def load_upload_checkpoint(output_dir):
+    """
+    Read the record of chats already uploaded from this output directory
     
-    args = parser.parse_args()
+    Returns:
+        dict: (input path, size, mtime_ns) to the uploaded chat's remote ID
+    """
+    checkpoint = {}
+    try:
+        with open(os.path.join(output_dir, UPLOAD_CHECKPOINT_NAME), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from an interrupted run
+                checkpoint[(record["input"], record["size"], record["mtime_ns"])] = record.get("remote_id")
+    except OSError:
+        pass
+    return checkpoint
+
+class BlobStore:
+    """
+    Content-addressed store for attachments extracted from chats
+    
+    Each blob is stored once under <root>/<first two hex digits>/<sha256><ext>,
+    so the same image used in many chats (or converted by many workers at
+    once) takes up space only once. Files are written to a temporary name
+    and renamed into place once on disk (see _replace_durably), which makes
+    concurrent writers safe. A stored blob of the wrong size, such as an
+    empty file left by a power loss, is replaced instead of reused.
+    """
+    
+    def __init__(self, root, url_prefix=""):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.written = 0
+        self.reused = 0
+        os.makedirs(root, exist_ok=True)
+    
+    def _store(self, fill, mime_type, name=None):
+        """
+        Store the bytes produced by fill(write) and return the file entry
+        
+        Args:
+            fill (callable): Called with a write function, feeds it the content
+            mime_type (str): MIME type of the content
+            name (str): Display name (defaults to the blob file name)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(prefix='.blob-', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                def write(data):
+                    nonlocal size
+                    digest.update(data)
+                    f.write(data)
+                    size += len(data)
+                fill(write)
+            
+            sha256 = digest.hexdigest()
+            extension = mimetypes.guess_extension(mime_type or '') or '.bin'
+            relative_path = f"{sha256[:2]}/{sha256}{extension}"
+            blob_path = os.path.join(self.root, sha256[:2], sha256 + extension)
+            if os.path.exists(blob_path) and os.path.getsize(blob_path) == size:
+                os.remove(temp_path)
+                self.reused += 1
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.chmod(temp_path, 0o644)
+                _replace_durably(temp_path, blob_path)
+                self.written += 1
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        return {
+            "type": "image" if (mime_type or '').startswith('image/') else "file",
+            "url": self.url_prefix + relative_path,
+            "name": name or f"{sha256}{extension}",
+            "content_type": mime_type,
+            "size": size,
+            "hash": sha256
+        }
+    
+    def add_base64(self, data, mime_type):
+        """
+        Decode and store base64 content slice by slice
+        
+        Args:
+            data (str): Base64-encoded content
+            mime_type (str): MIME type of the content
+            
+        Returns:
+            dict: OpenWebUI file entry referencing the blob
+        """
+        if any(char in data for char in ' \t\r\n'):
+            data = ''.join(data.split())
+        
+        def fill(write):
+            for start in range(0, len(data), BLOB_DECODE_BLOCK):
+                write(base64.b64decode(data[start:start + BLOB_DECODE_BLOCK]))
+        return self._store(fill, mime_type)
+    
+    def add_file(self, path, mime_type, name=None):
+        """
+        Copy a local file into the store
+        
+        Args:
+            path (str): File to store
+            mime_type (str): MIME type of the content
+            name (str): Display name (defaults to the blob file name)
+            
+        Returns:
+            dict: OpenWebUI file entry referencing the blob
+        """
+        def fill(write):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    write(block)
+        return self._store(fill, mime_type, name)
+    
+    def extract(self, chunk):
+        """
+        Move inline images and data of an AIStudio chunk into the store
+        
+        Covers inlineImage/inlineData on the chunk itself and inlineData
+        entries in its parts. The base64 payloads are removed from the chunk.
+        
+        Args:
+            chunk (dict): AIStudio chunk
+            
+        Returns:
+            list: OpenWebUI file entries, in chunk order
+        """
+        files = []
+        for holder in [chunk] + [part for part in chunk.get("parts", []) if isinstance(part, dict)]:
+            for key in INLINE_DATA_KEYS:
+                inline = holder.get(key)
+                if isinstance(inline, dict) and inline.get("data"):
+                    files.append(self.add_base64(inline.pop("data"), inline.get("mimeType")))
+        return files
+
+def build_drive_index(takeout_dir):
+    """
+    Map the Drive file IDs found in a Google Takeout tree to local paths
+    
+    Takeout names files after their titles, so IDs come from JSON sidecars
+    holding an "id" and the "title" (or "name") of a file next to them, and
+    otherwise from ID-shaped tokens in file names (as left by tools that
+    download by ID). Sidecar IDs take precedence.
+    
+    Args:
+        takeout_dir (str): Root of the extracted Takeout Drive folder
+        
+    Returns:
+        dict: Drive file ID to path relative to takeout_dir
+    """
+    index = {}
+    sidecars = {}
+    for dirpath, dirnames, filenames in os.walk(takeout_dir):
+        dirnames.sort()
+        names = set(filenames)
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            relative_path = os.path.relpath(path, takeout_dir)
+            
+            # Explicit ID from a small metadata sidecar
+            if filename.endswith('.json'):
+                try:
+                    if os.path.getsize(path) <= DRIVE_SIDECAR_MAX_BYTES:
+                        with open(path, 'rb') as f:
+                            metadata = json.loads(f.read())
+                        title = metadata.get("title") or metadata.get("name")
+                        if isinstance(metadata.get("id"), str) and title in names:
+                            sidecars[metadata["id"]] = os.path.join(os.path.dirname(relative_path), title)
+                            continue
+                except (OSError, ValueError, AttributeError, TypeError):
+                    pass
+            
+            # IDs may contain _ and -, so "photo_<id>" also yields the
+            # parts on either side of each separator
+            for token in _DRIVE_ID.findall(os.path.splitext(filename)[0]):
+                candidates = [token]
+                for separator in re.finditer(r'[_-]', token):
+                    candidates += [token[:separator.start()], token[separator.end():]]
+                for drive_id in candidates:
+                    if len(drive_id) >= 25:
+                        index.setdefault(drive_id, relative_path)
+    index.update(sidecars)
+    return index
+
+def load_drive_index(takeout_dir, index_path, rebuild=False):
+    """
+    Load the Drive index for takeout_dir, building and saving it if needed
+    
+    The index is only built once per Takeout tree; later runs (and every
+    worker process) just read it back.
+    
+    Args:
+        takeout_dir (str): Root of the extracted Takeout Drive folder
+        index_path (str): Where the index is kept
+        rebuild (bool): Rescan the tree even if a saved index exists
+        
+    Returns:
+        dict: Drive file ID to path relative to takeout_dir
+    """
+    root = os.path.abspath(takeout_dir)
+    if not rebuild:
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get("version") == DRIVE_INDEX_VERSION and saved.get("root") == root:
+                return saved["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+    
+    index = build_drive_index(takeout_dir)
+    parent = os.path.dirname(index_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": DRIVE_INDEX_VERSION, "root": root, "files": index}, f,
+                  ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temp_path, index_path)
+    return index
+
+# Drive indexes already loaded by this process, by index path
+_drive_indexes = {}
+
+class DriveFiles:
+    """
+    Resolve driveDocument/driveImage references against a Takeout tree
+    
+    Lookups go through the prebuilt index, so each reference costs a dict
+    lookup rather than a walk over the tree. Found files are copied into
+    the blob store if there is one and otherwise linked by file:// URL.
+    """
+    
+    def __init__(self, takeout_dir, index_path, blob_store=None):
+        self.takeout_dir = takeout_dir
+        self.blob_store = blob_store
+        self.found = 0
+        self.missing = 0
+        if index_path not in _drive_indexes:
+            _drive_indexes[index_path] = load_drive_index(takeout_dir, index_path)
+        self.index = _drive_indexes[index_path]
+    
+    def _file_entry(self, path):
+        mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        name = os.path.basename(path)
+        if self.blob_store is not None:
+            return self.blob_store.add_file(path, mime_type, name)
+        return {
+            "type": "image" if mime_type.startswith('image/') else "file",
+            "url": "file://" + urllib.parse.quote(os.path.abspath(path)),
+            "name": name,
+            "content_type": mime_type,
+            "size": os.path.getsize(path)
+        }
+    
+    def resolve(self, chunk):
+        """
+        Look up the Drive files referenced by an AIStudio chunk
+        
+        Args:
+            chunk (dict): AIStudio chunk
+            
+        Returns:
+            list: OpenWebUI file entries for the references found locally
+        """
+        files = []
+        for holder in [chunk] + [part for part in chunk.get("parts", []) if isinstance(part, dict)]:
+            for key in DRIVE_REF_KEYS:
+                ref = holder.get(key)
+                if not isinstance(ref, dict) or not ref.get("id"):
+                    continue
+                relative_path = self.index.get(ref["id"])
+                path = os.path.join(self.takeout_dir, relative_path) if relative_path else None
+                if path is None or not os.path.isfile(path):
+                    self.missing += 1
+                    continue
+                files.append(self._file_entry(path))
+                self.found += 1
+        return files
+
+class _JSONStream:
+    """
+    Minimal incremental JSON reader over a text file object
+    
+    Containers can be walked element by element while leaf values are
+    decoded with the stdlib C scanner, so only one element has to be held
+    in memory at a time.
+    """
+    
+    def __init__(self, f, block_size=STREAM_BLOCK_SIZE):
+        self.f = f
+        self.block_size = block_size
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0  # Characters discarded before buf
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def _fill(self):
+        # Grow the read size with the pending data so that a single huge
+        # value is re-scanned a logarithmic number of times, not linear
+        pending = len(self.buf) - self.pos
+        data = self.f.read(max(self.block_size, pending))
+        if not data:
+            self.eof = True
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+    
+    def _error(self, msg, pos=None):
+        if pos is None:
+            pos = self.pos
+        return ValueError(f"{msg}: char {self.offset + pos}")
+    
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of input)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ''
+            self._fill()
+    
+    def expect(self, char):
+        """Consume the given structural character"""
+        if self.peek() != char:
+            raise self._error(f"Expecting '{char}'")
+        self.pos += 1
+    
+    def value(self):
+        """Decode and return the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise self._error(e.msg, e.pos) from None
+                self._fill()
+                continue
+            # A number running up to the buffer end may be truncated
+            if (not self.eof and self.buf[self.pos] in '-0123456789'
+                    and _NUMBER_CHARS.match(self.buf, self.pos).end() == len(self.buf)):
+                self._fill()
+                continue
+            self.pos = end
+            return obj
+    
+    def skip(self):
+        """Consume the next value without materializing containers"""
+        char = self.peek()
+        if char == '{':
+            for _ in self.iter_object():
+                self.skip()
+        elif char == '[':
+            for _ in self.iter_items():
+                self.skip()
+        else:
+            self.value()
+    
+    def _next_separator(self, close):
+        char = self.peek()
+        self.pos += 1
+        if char == close:
+            return False
+        if char != ',':
+            self.pos -= 1
+            raise self._error(f"Expecting ',' or '{close}'")
+        return True
+    
+    def iter_object(self):
+        """
+        Walk an object, yielding each key
+        
+        The caller must consume the corresponding value (with value(),
+        skip() or a nested iterator) before advancing.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self.value()
+            self.expect(':')
+            yield key
+            if not self._next_separator('}'):
+                return
+    
+    def iter_items(self):
+        """Walk an array; the caller must consume each element as it is yielded"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if not self._next_separator(']'):
+                return
+    
+    def iter_array(self):
+        """Yield the decoded elements of an array one at a time"""
+        for _ in self.iter_items():
+            yield self.value()
+    
+    def end(self):
+        """Ensure nothing but whitespace follows the top-level value"""
+        if self.peek():
+            raise self._error("Extra data")
+
+def _iter_chunks(stream, top_level_keys):
+    """
+    Yield chunkedPrompt.chunks elements, then drain the rest of the file
+    
+    Args:
+        stream (_JSONStream): Stream positioned at the chunkedPrompt value
+        top_level_keys (iterator): The in-progress top-level object walk
+    """
+    for key in stream.iter_object():
+        if key == "chunks":
+            yield from stream.iter_array()
+        else:
+            stream.skip()
+    
+    # Validate the remainder of the document like json.load would
+    for _ in top_level_keys:
+        stream.skip()
+    stream.end()
+
+def _read_run_settings(f):
+    """Scan a separate handle on an AIStudio file for its runSettings"""
+    stream = _JSONStream(f)
+    for key in stream.iter_object():
+        if key == "runSettings":
+            return stream.value()
+        stream.skip()
+    return None
+
+def read_aistudio_stream(f, reopen=None):
+    """
+    Incrementally read an AIStudio prompt file
+    
+    Everything up to chunkedPrompt is decoded eagerly; chunkedPrompt.chunks
+    is returned as a lazy iterator that decodes one chunk at a time, so the
+    result can be passed straight to convert_aistudio_to_openwebui with
+    peak memory bounded by the largest single chunk. The file must stay
+    open until the chunks have been consumed.
+    
+    If runSettings comes after chunkedPrompt in the file it is looked up
+    through a second handle obtained from reopen; without one, the chunks
+    are read into memory instead.
+    
+    Args:
+        f (file): Text file object positioned at the start of the document
+        reopen (callable): Optional zero-argument function returning a new
+            text file object over the same document
+        
+    Returns:
+        dict: AIStudio data with a lazy chunkedPrompt.chunks iterator
+    """
+    stream = _JSONStream(f)
+    aistudio_data = {}
+    top_level_keys = stream.iter_object()
+    
+    for key in top_level_keys:
+        if key != "chunkedPrompt":
+            aistudio_data[key] = stream.value()
+            continue
+        
+        if "runSettings" not in aistudio_data:
+            if reopen is None:
+                # No second handle available, fall back to a full read
+                aistudio_data[key] = stream.value()
+                continue
+            with reopen() as lookahead:
+                run_settings = _read_run_settings(lookahead)
+            if run_settings is not None:
+                aistudio_data["runSettings"] = run_settings
+        
+        aistudio_data[key] = {"chunks": _iter_chunks(stream, top_level_keys)}
+        return aistudio_data
+    
+    stream.end()
+    return aistudio_data
+
+def looks_like_aistudio(head):
+    """
+    Guess from the first bytes of a file whether it is an AIStudio prompt
+    
+    Args:
+        head (bytes): Start of the file (SNIFF_BYTES is plenty)
+        
+    Returns:
+        bool: False for anything that is not a JSON object mentioning one of
+        the AIStudio top-level keys, such as PDFs, images or other JSON
+    """
+    return head.lstrip().startswith(b'{') and any(key in head for key in AISTUDIO_KEYS)
+
+def _file_sha256(f):
+    """Return the hex SHA-256 digest of a binary file's remaining contents"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+def conversation_key(chunks):
+    """
+    Hash the conversation held by AIStudio chunks
+    
+    Only the chunk fields in DEDUP_CHUNK_KEYS are hashed, in canonical form
+    (sorted keys, no whitespace), so copies of a prompt match regardless of
+    file name, key order, formatting and token counts.
+    
+    Args:
+        chunks (iterable): AIStudio chunks in conversation order
+        
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(_canonical_chunk(chunk))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def _canonical_chunk(chunk):
+    """Canonical JSON bytes of the DEDUP_CHUNK_KEYS fields of a chunk"""
+    if isinstance(chunk, dict):
+        chunk = {key: chunk[key] for key in DEDUP_CHUNK_KEYS if key in chunk}
+    return json.dumps(chunk, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def _chunk_digest(chunk):
+    """Short digest identifying a chunk's content, see _canonical_chunk"""
+    return hashlib.blake2b(_canonical_chunk(chunk), digest_size=16).digest()
+
+def _claim_conversation(claims_dir, key, index):
+    """
+    Register batch input number index as holding conversation key
+    
+    Each conversation gets a directory in claims_dir with one empty file per
+    input that holds it, which worker processes can share without locking.
+    The lowest index of a conversation never sees an earlier claim, so it is
+    always converted; later ones usually see it and skip conversion.
+    
+    Returns:
+        bool: True if an earlier input already holds the same conversation
+    """
+    key_dir = os.path.join(claims_dir, key)
+    os.makedirs(key_dir, exist_ok=True)
+    open(os.path.join(key_dir, str(index)), 'wb').close()
+    return any(int(name) < index for name in os.listdir(key_dir))
+
+def minhash_signature(messages, permutations=NEAR_DUP_PERMUTATIONS, shingle_words=NEAR_DUP_SHINGLE_WORDS):
+    """
+    MinHash signature of the word shingles of a conversation
+    
+    Uses one-permutation hashing: every shingle is hashed once, the low bits
+    of the hash pick a signature slot and the remaining bits compete for
+    that slot's minimum, which costs one hash per shingle instead of one per
+    shingle and slot. Empty slots borrow the value of the next filled one.
+    Shingle hashes are rolled over the hashes of their words, so each
+    distinct word is hashed only once.
+    The share of equal slots in two signatures estimates the Jaccard
+    similarity of their shingle sets (see signature_similarity).
+    
+    Args:
+        messages (iterable): Lists of lowercased words, one per message;
+            shingles don't cross message boundaries
+        permutations (int): Signature length
+        shingle_words (int): Words per shingle
+        
+    Returns:
+        tuple: Signature, or None if there are no words at all
+    """
+    slot_bits = permutations.bit_length() - 1
+    slot_mask = permutations - 1
+    mask = (1 << 64) - 1
+    leading = pow(_SHINGLE_MULTIPLIER, shingle_words - 1, 1 << 64)
+    word_hashes = {}
+    minimums = [None] * permutations
+    for words in messages:
+        hashes = []
+        for word in words:
+            word_hash = word_hashes.get(word)
+            if word_hash is None:
+                word_hash = word_hashes[word] = int.from_bytes(
+                    hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'big')
+            hashes.append(word_hash)
+        
+        # Polynomial hash of each window of shingle_words words (the whole
+        # message if it is shorter)
+        first = min(shingle_words, len(hashes)) - 1
+        value = 0
+        for i, word_hash in enumerate(hashes):
+            if i >= shingle_words:
+                value -= hashes[i - shingle_words] * leading
+            value = (value * _SHINGLE_MULTIPLIER + word_hash) & mask
+            if i < first:
+                continue
+            slot = value & slot_mask
+            rest = value >> slot_bits
+            if minimums[slot] is None or rest < minimums[slot]:
+                minimums[slot] = rest
+    
+    # Fill empty slots from the next filled slot, offset by the distance so
+    # that borrowed values only match the same borrowing elsewhere
+    if all(value is None for value in minimums):
+        return None
+    signature = list(minimums)
+    for slot in range(permutations):
+        distance = 0
+        while minimums[(slot + distance) % permutations] is None:
+            distance += 1
+        signature[slot] = minimums[(slot + distance) % permutations] + (distance << (64 - slot_bits))
+    return tuple(signature)
+
+def signature_similarity(a, b):
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+def cluster_near_duplicates(signatures, threshold=NEAR_DUP_THRESHOLD, bands=NEAR_DUP_BANDS):
+    """
+    Group near-duplicate MinHash signatures with LSH banding
+    
+    Each signature is cut into bands of consecutive slots. Signatures that
+    agree on a whole band share a bucket and are compared with the
+    signatures already in it until one matches, so unrelated signatures are
+    never compared and the work grows with the number of signatures rather
+    than the number of pairs. Matches at or above threshold are merged into
+    clusters (union-find). With 42 bands of 3 slots, pairs at a similarity
+    of 0.5 share a bucket with over 99% probability.
+    
+    Args:
+        signatures (dict): Key to signature, in input order
+        threshold (float): Minimum estimated Jaccard similarity
+        bands (int): Number of bands; more bands find less similar pairs
+        
+    Returns:
+        list: Clusters of two or more keys, in input order
+    """
+    keys = list(signatures)
+    if not keys:
+        return []
+    parent = list(range(len(keys)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    rows = len(signatures[keys[0]]) // bands
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(keys):
+            signature = signatures[key]
+            members = buckets.setdefault(signature[band * rows:(band + 1) * rows], [])
+            for j in members:
+                if find(j) == find(i):
+                    break
+                if signature_similarity(signatures[keys[j]], signature) >= threshold:
+                    parent[max(find(j), find(i))] = min(find(j), find(i))
+                    break
+            else:
+                members.append(i)
+    
+    clusters = {}
+    for i, key in enumerate(keys):
+        clusters.setdefault(find(i), []).append(key)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+@contextmanager
+def _open_prompt(input_path, source=None, json_backend="auto", sniff=False):
+    """
+    Open a batch input for a pass over its chunks
+    
+    Small files are parsed in one go and large ones streamed, as in
+    _convert_file, so the chunks must be consumed inside the with block.
+    
+    Args:
+        input_path (str): Input file
+        source: Read the input from here instead, see _input_opener
+        json_backend (str): JSON implementation, see get_json_backend
+        sniff (bool): Check the first bytes with looks_like_aistudio
+        
+    Yields:
+        dict: AIStudio data, or None for files that fail sniffing or don't
+        hold a JSON object
+    """
+    backend = get_json_backend(json_backend)
+    size, open_input = _input_opener(input_path, source)
+    with open_input() as f:
+        if sniff and not looks_like_aistudio(f.read(SNIFF_BYTES)):
+            yield None
+            return
+        f.seek(0)
+        if size <= WHOLE_FILE_MAX_BYTES:
+            aistudio_data = backend.loads(f.read())
+        else:
+            f = io.TextIOWrapper(f, encoding='utf-8')
+            aistudio_data = read_aistudio_stream(f, reopen=lambda: io.TextIOWrapper(open_input(), encoding='utf-8'))
+        yield aistudio_data if isinstance(aistudio_data, dict) else None
+
+def _sign_file(input_path, source=None, json_backend="auto", sniff=False):
+    """
+    Read an AIStudio file and compute its MinHash signature
+    
+    Thought chunks are left out, so variants that only differ in the model's
+    reasoning still match.
+    
+    Returns:
+        dict: signature (None for chats without text), messages and words;
+        None for files that fail sniffing
+    """
+    with _open_prompt(input_path, source, json_backend, sniff) as aistudio_data:
+        if aistudio_data is None:
+            return None
+        
+        counts = {"messages": 0, "words": 0}
+        def message_words():
+            for chunk in aistudio_data.get("chunkedPrompt", {}).get("chunks", []):
+                if chunk.get("isThought", False):
+                    continue
+                words = chunk.get("text", "").lower().split()
+                counts["messages"] += 1
+                counts["words"] += len(words)
+                yield words
+        
+        signature = minhash_signature(message_words())
+    return dict(counts, signature=signature)
+
+def _chunk_prefix(input_path, source=None, json_backend="auto", sniff=False):
+    """
+    Digests of the first MERGE_PREFIX_CHUNKS chunks of an AIStudio file,
+    leaving out thought chunks
+    
+    Returns:
+        tuple: Chunk digests, or None for shorter prompts and other files
+    """
+    with _open_prompt(input_path, source, json_backend, sniff) as aistudio_data:
+        if aistudio_data is None:
+            return None
+        chunks = aistudio_data.get("chunkedPrompt", {}).get("chunks", [])
+        prefix = tuple(itertools.islice((_chunk_digest(chunk) for chunk in chunks
+                                         if not chunk.get("isThought", False)), MERGE_PREFIX_CHUNKS))
+    return prefix if len(prefix) == MERGE_PREFIX_CHUNKS else None
+
+def _prefix_task(task):
+    """
+    Worker entry point for the --merge-branches grouping pass
+    
+    Returns:
+        tuple: (input_path, result of _chunk_prefix, or None on any error)
+    """
+    input_path, options = task
+    try:
+        return input_path, _chunk_prefix(input_path, **options)
+    except Exception:
+        return input_path, None
+
+def _signature_task(task):
+    """
+    Worker entry point for the near-duplicate pass
+    
+    Args:
+        task (tuple): (input_path, options) where options are keyword
+            arguments for _sign_file
+        
+    Returns:
+        tuple: (input_path, result of _sign_file, or None on any error;
+        such files are simply left out of the clustering)
+    """
+    input_path, options = task
+    try:
+        return input_path, _sign_file(input_path, **options)
+    except Exception:
+        return input_path, None
+
+def is_archive(path):
+    """True if path is a zip or tar file that batch mode can read directly"""
+    return os.path.isfile(path) and path.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+# Zip archives opened by this process, by path
+_zip_archives = {}
+
+def _zip_archive(archive_path):
+    if archive_path not in _zip_archives:
+        _zip_archives[archive_path] = zipfile.ZipFile(archive_path)
+    return _zip_archives[archive_path]
+
+def _close_archives():
+    while _zip_archives:
+        _zip_archives.popitem()[1].close()
+
+def _input_opener(input_path, source=None):
+    """
+    Return (size, open function) for a conversion input
+    
+    Args:
+        input_path (str): Path of the input file
+        source: Where to read the input from instead: raw bytes, a
+            (zip archive path, member name) pair or another file path
+        
+    Returns:
+        tuple: (size in bytes, function returning a new binary file object)
+    """
+    if isinstance(source, bytes):
+        return len(source), lambda: io.BytesIO(source)
+    if isinstance(source, tuple):
+        archive_path, member = source
+        archive = _zip_archive(archive_path)
+        return archive.getinfo(member).file_size, lambda: archive.open(member)
+    path = source or input_path
+    return os.path.getsize(path), lambda: open(path, 'rb')
+
+def _convert_file(input_path, output_path, compact=False, element=False, known_sha256=None,
+                  stable_ids=False, row=False, json_backend="auto", blob_dir=None,
+                  blob_url_prefix="", takeout_dir=None, drive_index=None, source=None,
+                  compression=None, compress_level=None, compress_threads=0, sniff=False,
+                  history_only=False, catalog=False, search=False, dedup_dir=None, dedup_index=None,
+                  branches=None, name=None):
+    """
+    Convert a single AIStudio file, raising on any error
+    
+    Args:
+        input_path (str): Path to input AIStudio file
+        output_path (str): Path to output OpenWebUI JSON file
+        compact (bool): Write compact JSON instead of indented JSON
+        element (bool): Write the chat as a bare array element for
+            BundleWriter instead of a complete JSON document
+        known_sha256 (str): Content hash from a previous run; if the file
+            still matches it, conversion is skipped
+        stable_ids (bool): Derive chat and message IDs from the input's name
+            and content hash, so that identical copies get IDs of their own
+        row (bool): Return the chat as an OpenWebUI database row under
+            "rows" instead of writing output_path
+        json_backend (str): JSON implementation, see get_json_backend
+        blob_dir (str): Extract inline images into this content-addressed
+            store instead of dropping them
+        blob_url_prefix (str): Prefix for blob URLs in the output
+        takeout_dir (str): Attach Drive documents and images referenced by
+            the chat from this local Takeout tree
+        drive_index (str): Path of the Drive index for takeout_dir
+        source: Read the input from here instead of input_path, which then
+            only names it; see _input_opener
+        compression (str): Compress the output file, see open_output
+        compress_level (int): Compression level
+        compress_threads (int): zstd compression threads
+        sniff (bool): Check the first bytes with looks_like_aistudio and skip
+            other files without reading them in full
+        history_only (bool): Keep messages only in chat.history, leaving
+            chat.messages empty
+        catalog (bool): Also return the chat's title, model and message and
+            thought counts under "catalog", see CatalogWriter
+        search (bool): Also return the chat's title and the text and
+            reasoning of each message under "search", see SearchIndexWriter
+        dedup_dir (str): Claims directory for duplicate detection; the
+            conversation is hashed with conversation_key and only converted
+            if no earlier input holds it, see _claim_conversation
+        dedup_index (int): Position of this input in the batch
+        branches (list): (input path, source) of further variants of this
+            conversation, merged with it into one branched chat by
+            convert_aistudio_branches; they are read in full
+        name (str): Name of the input in its batch for stable_ids; defaults
+            to the file name
+        
+    Returns:
+        dict: sha256 of the input plus either the converted chat_ids (and
+        rows, catalog, search, blobs_written, blobs_reused, drive_found, drive_missing) or
+        unchanged=True; just skipped=True for files that fail sniffing.
+        With dedup_dir, converted files report their dedup_key and
+        duplicates are returned unconverted with duplicate set to the key.
+        bytes_in is always set; converted files also report bytes_out,
+        messages and timings (seconds per PROFILE_PHASES phase: reading
+        and hashing, parsing, converting, serializing and writing; the
+        writer pulls messages from the converter, so convert and write are
+        timed around those calls and serialize is the rest of that span;
+        streamed inputs are parsed while converting)
+    """
+    backend = get_json_backend(json_backend)
+    blob_store = BlobStore(blob_dir, blob_url_prefix) if blob_dir else None
+    drive_files = DriveFiles(takeout_dir, drive_index, blob_store) if takeout_dir else None
+    
+    # Small files are read once, hashed and parsed in one go; large ones are
+    # hashed in a separate pass and then streamed. Either way a peek at the
+    # first few KB comes first.
+    timings = dict.fromkeys(PROFILE_PHASES, 0.0)
+    start = time.perf_counter()
+    size, open_input = _input_opener(input_path, source)
+    with open_input() as f:
+        head = f.read(SNIFF_BYTES)
+        if sniff and not looks_like_aistudio(head):
+            return {"skipped": True, "bytes_in": size}
+        
+        f.seek(0)
+        if size <= WHOLE_FILE_MAX_BYTES:
+            raw = f.read()
+            sha256 = hashlib.sha256(raw).hexdigest()
+        else:
+            raw = None
+            sha256 = _file_sha256(f)
+    
+    if sha256 == known_sha256:
+        return {"sha256": sha256, "unchanged": True, "bytes_in": size}
+    
+    # Get filename for title
+    filename = os.path.basename(input_path)
+    id_seed = hashlib.sha256(f"{name if name is not None else filename}\0{sha256}".encode('utf-8'))
+    
+    # Feed the AIStudio data through the converter into the output file
+    reader = nullcontext() if raw is not None else io.TextIOWrapper(open_input(), encoding='utf-8')
+    timings["read"] = time.perf_counter() - start
+    with reader as f:
+        start = time.perf_counter()
+        if raw is not None:
+            aistudio_data = backend.loads(raw)
+            del raw
+            timings["parse"] = time.perf_counter() - start
+            start = time.perf_counter()
+        else:
+            aistudio_data = read_aistudio_stream(
+                f, reopen=lambda: io.TextIOWrapper(open_input(), encoding='utf-8'))
+        if not isinstance(aistudio_data, dict):
+            raise ValueError("Not an AIStudio prompt: top-level JSON value is not an object")
+        
+        # Hash the conversation before converting it; streamed chunks can
+        # only be consumed once, so they are hashed in a pass of their own
+        if dedup_dir is not None:
+            chunks = aistudio_data.get("chunkedPrompt", {}).get("chunks", [])
+            if isinstance(chunks, list):
+                dedup_key = conversation_key(chunks)
+            else:
+                with io.TextIOWrapper(open_input(), encoding='utf-8') as lookahead:
+                    dedup_data = read_aistudio_stream(
+                        lookahead, reopen=lambda: io.TextIOWrapper(open_input(), encoding='utf-8'))
+                    dedup_key = conversation_key(dedup_data.get("chunkedPrompt", {}).get("chunks", []))
+            if _claim_conversation(dedup_dir, dedup_key, dedup_index):
+                return {"sha256": sha256, "duplicate": dedup_key, "bytes_in": size}
+        
+        thoughts = {} if catalog or search else None
+        if branches:
+            # Read the other variants; stable IDs depend on all of them
+            prompts = [aistudio_data]
+            for branch_path, branch_source in branches:
+                with _open_prompt(branch_path, branch_source, json_backend) as branch_data:
+                    if branch_data is None:
+                        raise ValueError(f"Not an AIStudio prompt: {branch_path}")
+                    chunks = list(branch_data.get("chunkedPrompt", {}).get("chunks", []))
+                branch_data["chunkedPrompt"] = {"chunks": chunks}
+                id_seed.update(conversation_key(chunks).encode('ascii'))
+                size += _input_opener(branch_path, branch_source)[0]
+                prompts.append(branch_data)
+            converted = convert_aistudio_branches(prompts, filename,
+                                                  id_seed=id_seed.hexdigest() if stable_ids else None,
+                                                  blob_store=blob_store, drive_files=drive_files,
+                                                  thoughts=thoughts)
+        else:
+            converted = convert_aistudio_stream(aistudio_data, filename,
+                                                id_seed=id_seed.hexdigest() if stable_ids else None,
+                                                blob_store=blob_store, drive_files=drive_files,
+                                                thoughts=thoughts)
+        result = {
+            "sha256": sha256,
+            "chat_ids": [converted[0]["id"]] if converted is not None else [],
+            "bytes_in": size,
+            "messages": 0
+        }
+        if dedup_dir is not None:
+            result["dedup_key"] = dedup_key
+        if catalog:
+            chat = converted[0]["chat"] if converted is not None else {}
+            result["catalog"] = {
+                "chat_id": converted[0]["id"] if converted is not None else None,
+                "title": chat.get("title"),
+                "model": chat["models"][0] if chat.get("models") else None,
+                "user_messages": 0,
+                "assistant_messages": 0,
+                "thoughts": 0
+            }
+        if search and converted is not None:
+            result["search"] = {"title": converted[0]["chat"]["title"], "messages": []}
+        
+        # Count messages (and for the catalog, roles and thoughts) and
+        # collect their text for the search index as the writer consumes them
+        timings["convert"] = time.perf_counter() - start
+        if converted is not None:
+            def counted(messages):
+                messages = iter(messages)
+                while True:
+                    start = time.perf_counter()
+                    message = next(messages, _MISSING)
+                    timings["convert"] += time.perf_counter() - start
+                    if message is _MISSING:
+                        return
+                    result["messages"] += 1
+                    message_thoughts = thoughts.pop(message["id"], ()) if thoughts is not None else ()
+                    if catalog:
+                        entry = result["catalog"]
+                        if message["role"] == "user":
+                            entry["user_messages"] += 1
+                        elif message["role"] == "assistant":
+                            entry["assistant_messages"] += 1
+                        entry["thoughts"] += len(message_thoughts)
+                    if search:
+                        # Index the reasoning apart from the response text
+                        content = message["content"]
+                        reasoning = None
+                        if message_thoughts:
+                            reasoning = "\n\n".join(message_thoughts)
+                            content = content[len(_reasoning_section(message_thoughts)):]
+                        result["search"]["messages"].append((message["id"], message["role"],
+                                                             content, reasoning))
+                    yield message
+            converted = (converted[0], counted(converted[1]))
+        
+        start = time.perf_counter()
+        setup_seconds = timings["convert"]
+        if row:
+            result["rows"] = [_chat_row(converted, backend, history_only)] if converted is not None else []
+            result["bytes_out"] = sum(len(row["chat"]) for row in result["rows"])
+        else:
+            timings["write"] = _write_output(output_path, converted, compact, element, backend,
+                                             compression, compress_level, compress_threads, history_only)
+            result["bytes_out"] = os.path.getsize(output_path)
+        timings["serialize"] = max(0.0, time.perf_counter() - start - timings["write"]
+                                   - (timings["convert"] - setup_seconds))
+    result["timings"] = timings
+    
+    if blob_store is not None:
+        result["blobs_written"] = blob_store.written
+        result["blobs_reused"] = blob_store.reused
+    if drive_files is not None:
+        result["drive_found"] = drive_files.found
+        result["drive_missing"] = drive_files.missing
+    return result
+
+class _TimedWriter(io.RawIOBase):
+    """Binary output wrapper adding up the time spent in write and close"""
+    
+    def __init__(self, target):
+        super().__init__()
+        self.target = target
+        self.seconds = 0.0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        start = time.perf_counter()
+        self.target.write(data)
+        self.seconds += time.perf_counter() - start
+        return len(data)
+    
+    def close(self):
+        if not self.closed:
+            start = time.perf_counter()
+            self.target.close()
+            self.seconds += time.perf_counter() - start
+        super().close()
+
+def _write_output(output_path, converted, compact, element, backend,
+                  compression=None, compress_level=None, compress_threads=0, history_only=False):
+    """
+    Stream a converted chat into output_path
+    
+    The chat is written to a temporary file next to output_path that is
+    renamed over it once complete, so output_path always holds either the
+    previous version or the whole new one, even if the process is killed.
+    Bundle elements are scratch files and are renamed without syncing.
+    
+    Returns:
+        float: Seconds spent writing (and compressing) the output
+    """
+    temp_path = output_path + '.tmp'
+    try:
+        binary = _TimedWriter(open_output(temp_path, compression, compress_level, compress_threads))
+        with io.TextIOWrapper(binary, encoding='utf-8') as out:
+            if not element:
+                write_openwebui_json(out, converted, compact=compact, backend=backend,
+                                     history_only=history_only)
+            elif converted is not None:
+                _write_chat_element(out, converted, _json_options(compact), backend=backend,
+                                    history_only=history_only)
+        start = time.perf_counter()
+        if element:
+            os.replace(temp_path, output_path)
+        else:
+            _replace_durably(temp_path, output_path)
+        return binary.seconds + time.perf_counter() - start
+    except BaseException:
+        # Don't leave a truncated output file behind
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def process_file(input_path, output_path, compact=False, stable_ids=False, json_backend="auto",
+                 blob_dir=None, blob_url_prefix="", takeout_dir=None, drive_index=None,
+                 rebuild_drive_index=False, compression=None, compress_level=None,
+                 compress_threads=0, log_path=None, history_only=False):
+    """
+    Process a single AIStudio file and convert it to OpenWebUI format
+    
+    Args:
+        input_path (str): Path to input AIStudio file
+        output_path (str): Path to output OpenWebUI JSON file
+        compact (bool): Write compact JSON instead of indented JSON
+        stable_ids (bool): Derive chat and message IDs from the file name
+            and content
+        json_backend (str): JSON implementation, see get_json_backend
+        blob_dir (str): Extract inline images into this content-addressed store
+        blob_url_prefix (str): Prefix for blob URLs in the output
+        takeout_dir (str): Attach referenced Drive files from this Takeout tree
+        drive_index (str): Where the Drive index is kept (defaults to the
+            output file's directory)
+        rebuild_drive_index (bool): Rescan takeout_dir even if an index exists
+        compression (str): Write gzip or zstd compressed output, see open_output
+        compress_level (int): Compression level
+        compress_threads (int): zstd compression threads
+        log_path (str): Also record the outcome in a JSONL results log
+        history_only (bool): Leave out the chat.messages copy of the messages
+    """
+    if takeout_dir and drive_index is None:
+        drive_index = os.path.join(os.path.dirname(output_path), DRIVE_INDEX_NAME)
+    results_log = ResultsLog(log_path) if log_path is not None else None
+    try:
+        if takeout_dir and rebuild_drive_index:
+            _drive_indexes[drive_index] = load_drive_index(takeout_dir, drive_index, rebuild=True)
+        result = _convert_file(input_path, output_path, compact=compact, stable_ids=stable_ids,
+                               json_backend=json_backend, blob_dir=blob_dir,
+                               blob_url_prefix=blob_url_prefix, takeout_dir=takeout_dir,
+                               drive_index=drive_index, compression=compression,
+                               compress_level=compress_level, compress_threads=compress_threads,
+                               history_only=history_only)
+        record_phase_timings(result["timings"])
+        
+        if results_log is not None:
+            results_log.add(input_path, "converted", output_path, result)
+        print(f"Successfully converted {input_path} to {output_path}")
+        return True
+    except Exception as e:
+        if results_log is not None:
+            results_log.add(input_path, "error", output_path, {"error_type": type(e).__name__}, str(e))
+        print(f"Error converting {input_path}: {str(e)}")
+        return False
+    finally:
+        if results_log is not None:
+            results_log.close()
+
+def _convert_task(task):
+    """
+    Worker entry point for batch mode
+    
+    Exceptions are caught here and returned as a message so that a single
+    bad file never tears down the process pool.
+    
+    Args:
+        task (tuple): (input_path, output_path, options) where options are
+            keyword arguments for _convert_file
+        
+    Returns:
+        tuple: (input_path, output_path, error message or None, result of
+        _convert_file, or {"error_type": exception class name} on error)
+    """
+    input_path, output_path, options = task
+    try:
+        result = _convert_file(input_path, output_path, **options)
+        return input_path, output_path, None, result
+    except Exception as e:
+        return input_path, output_path, str(e), {"error_type": type(e).__name__}
+
+def _run_tasks(func, tasks, workers):
+    """
+    Run func over tasks, in-process or on a process pool
+    
+    Results are yielded in submission order regardless of which worker
+    finishes first, and at most a few tasks per worker are in flight so
+    that tasks may be a lazy iterable. Results are collected as they
+    finish, so a slow task only holds up the results after it (up to
+    RESULTS_PER_WORKER per worker), not the other workers.
+    
+    Args:
+        func (callable): Picklable, module-level function taking one task
+        tasks (iterable): Task arguments
+        workers (int): Number of worker processes (1 runs in-process)
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    
+    tasks = iter(tasks)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        finished = {}
+        submitted = 0
+        next_index = 0
+        while True:
+            # Keep the workers busy, bounding both the tasks in flight and
+            # the results waiting for an earlier one
+            while len(running) < workers * TASKS_PER_WORKER \
+                    and len(finished) < workers * RESULTS_PER_WORKER:
+                task = next(tasks, _MISSING)
+                if task is _MISSING:
+                    break
+                running[executor.submit(func, task)] = submitted
+                submitted += 1
+            if not running:
+                break
+            
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                finished[running.pop(future)] = future.result()
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+
+def load_manifest(output_dir):
+    """
+    Load the conversion manifest left in output_dir by a previous batch run
+    
+    Args:
+        output_dir (str): Batch output directory
+        
+    Returns:
+        dict: Input path (relative to the input directory) to its entry with
+        size, mtime_ns, sha256, output and chat_ids; empty if there is no
+        readable manifest
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("files", {})
+
+def save_manifest(output_dir, entries):
+    """
+    Atomically replace the conversion manifest in output_dir
+    
+    Args:
+        output_dir (str): Batch output directory
+        entries (dict): Manifest entries as returned by load_manifest
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": MANIFEST_VERSION, "files": entries}, f,
+                  ensure_ascii=False, indent=1, sort_keys=True)
+    _replace_durably(temp_path, manifest_path)
+
+def load_journal(output_dir, settings):
+    """
+    Read the journal left in output_dir by an interrupted batch run
+    
+    The first line of a journal holds the settings of the run that wrote
+    it, every further line one completed input and its manifest entry.
+    
+    Args:
+        output_dir (str): Batch output directory
+        settings (dict): Settings of the current run; a journal written
+            with different settings is not resumed
+    
+    Returns:
+        dict: Input path to its manifest entry, or None if there is no
+        journal to resume
+    """
+    entries = {}
+    try:
+        with open(os.path.join(output_dir, JOURNAL_NAME), 'r', encoding='utf-8') as f:
+            try:
+                if json.loads(f.readline()).get("settings") != settings:
+                    return None
+            except ValueError:
+                return None
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from an interrupted run
+                entries[record["input"]] = record["entry"]
+    except OSError:
+        return None
+    return entries
+
+def _glob_match(relative_path, patterns):
+    """True if a path (with / separators) or its last component matches any pattern"""
+    name = relative_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(relative_path, pattern) or fnmatch.fnmatchcase(name, pattern)
+               for pattern in patterns)
+
+class ResultsLog:
+    """
+    Machine-readable JSONL log with one record per batch input
+    
+    Records are handed to a background thread, which serializes them and
+    writes them through a large buffer, so logging never holds up the
+    conversion loop. Totals over converted files are kept for the closing
+    summary record.
+    
+    Each record has input, output, status (converted, uploaded, unchanged,
+    skipped, duplicate or error), error, error_type, duplicate_of,
+    bytes_in, bytes_out, messages and timings (seconds per phase, see
+    _convert_file).
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.counts = {}
+        self.error_types = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages = 0
+        self._start = time.perf_counter()
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'w', encoding='utf-8', buffering=RESULTS_LOG_BUFFER)
+        self._thread = threading.Thread(target=self._write_records, name='results-log', daemon=True)
+        self._thread.start()
+    
+    def _write_records(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.close()
+    
+    def add(self, input_path, status, output_path=None, result=None, error=None):
+        """
+        Log the outcome for one input
+        
+        Args:
+            input_path (str): Input file
+            status (str): converted, uploaded, unchanged, skipped, duplicate,
+                merged or error
+            output_path (str): Where the chat went (file, bundle, database
+                or API URL)
+            result (dict): Result from _convert_file, or _convert_task's
+                error details
+            error (str): Error message
+        """
+        result = result or {}
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if status == "error":
+            error_type = result.get("error_type", "Exception")
+            self.error_types[error_type] = self.error_types.get(error_type, 0) + 1
+        if status in ("converted", "uploaded"):
+            self.bytes_in += result.get("bytes_in", 0)
+            self.bytes_out += result.get("bytes_out", 0)
+            self.messages += result.get("messages", 0)
+        timings = result.get("timings")
+        self._queue.put({
+            "input": input_path,
+            "output": output_path,
+            "status": status,
+            "error": error,
+            "error_type": result.get("error_type") if status == "error" else None,
+            "duplicate_of": result.get("duplicate_of"),
+            "bytes_in": result.get("bytes_in"),
+            "bytes_out": result.get("bytes_out"),
+            "messages": result.get("messages"),
+            "timings": {phase: round(seconds, 6) for phase, seconds in timings.items()} if timings else None
+        })
+    
+    def summary(self):
+        """Totals over all logged inputs"""
+        return {
+            "counts": dict(self.counts),
+            "error_types": dict(self.error_types),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "messages": self.messages,
+            "seconds": time.perf_counter() - self._start
+        }
+    
+    def close(self):
+        """
+        Append the summary record and wait for everything to be written
+        
+        Returns:
+            dict: The summary, as from summary()
+        """
+        summary = self.summary()
+        self._queue.put({"summary": summary})
+        self._queue.put(None)
+        self._thread.join()
+        return summary
+
+def iter_input_files(input_dir, recursive=False, include=None, exclude=None, skip_dirs=()):
+    """
+    Lazily discover input files below input_dir
+    
+    Directories are read with os.scandir, whose entries already know
+    whether they are files or directories, and entries are yielded as each
+    directory is read rather than after a full listing. Within a directory
+    entries come in name order, so the overall order is stable.
+    
+    Args:
+        input_dir (str): Directory to search
+        recursive (bool): Descend into subdirectories
+        include (list): Glob patterns; if given, only files matching one
+            are yielded
+        exclude (list): Glob patterns for files and directories to skip
+        skip_dirs (iterable): Absolute directory paths never descended into,
+            such as an output directory inside input_dir
+        
+    Yields:
+        tuple: (relative path with / separators, os.DirEntry)
+    """
+    skip_dirs = {os.path.abspath(path) for path in skip_dirs}
+    pending = [("", input_dir)]
+    while pending:
+        prefix, directory = pending.pop()
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            relative_path = prefix + entry.name
+            if exclude and _glob_match(relative_path, exclude):
+                continue
+            if entry.is_dir():
+                # Don't follow directory symlinks, which could loop
+                if recursive and not entry.is_symlink() and os.path.abspath(entry.path) not in skip_dirs:
+                    subdirectories.append((relative_path + '/', entry.path))
+                continue
+            if not entry.is_file():
+                continue
+            if include and not _glob_match(relative_path, include):
+                continue
+            yield relative_path, entry
+        
+        # Depth first, in name order
+        pending.extend(reversed(subdirectories))
+
+def iter_archive_members(archive_path, include=None, exclude=None, spool_dir=None):
+    """
+    Lazily list the files in a zip or tar archive
+    
+    Zip members are read later by the workers themselves, so they convert
+    in parallel straight out of the archive. Tar archives only allow
+    sequential reads, so each tar member is read here as the archive is
+    streamed: small members are passed on in memory, larger ones are copied
+    to a temporary file in spool_dir (removed by the caller).
+    
+    Members are filtered like iter_input_files with recursive=True; an
+    exclude pattern matching any parent directory skips the member.
+    
+    Args:
+        archive_path (str): Zip or tar(.gz/.bz2/.xz) file
+        include (list): Glob patterns; if given, only matching members
+        exclude (list): Glob patterns for members and directories to skip
+        spool_dir (str): Directory for large tar members
+        
+    Yields:
+        tuple: (member path, size, mtime_ns, load) where load() returns the
+        source argument for _convert_file; for tar archives it must be
+        called before the next member is requested
+    """
+    def wanted(name):
+        # Normalized member path, or None to skip it; paths escaping the
+        # archive root are never used to name outputs
+        parts = [part for part in name.split('/') if part not in ('', '.')]
+        if not parts or '..' in parts:
+            return None
+        if exclude and any(_glob_match('/'.join(parts[:i]), exclude) for i in range(1, len(parts) + 1)):
+            return None
+        name = '/'.join(parts)
+        return name if not include or _glob_match(name, include) else None
+    
+    if archive_path.lower().endswith(ZIP_SUFFIXES):
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [(wanted(info.filename), info) for info in archive.infolist() if not info.is_dir()]
+        for name, info in sorted((member for member in members if member[0]), key=lambda member: member[0]):
+            mtime_ns = int(datetime(*info.date_time).timestamp()) * 1_000_000_000
+            yield name, info.file_size, mtime_ns, lambda member=info.filename: (archive_path, member)
+        return
+    
+    # Stream mode: never seek backwards, so compressed tars are read once
+    with tarfile.open(archive_path, 'r|*') as archive:
+        for member in archive:
+            name = wanted(member.name) if member.isfile() else None
+            if name is None:
+                continue
+            
+            def load(member=member):
+                f = archive.extractfile(member)
+                if member.size <= WHOLE_FILE_MAX_BYTES:
+                    return f.read()
+                fd, spool_path = tempfile.mkstemp(prefix='.member-', dir=spool_dir)
+                with os.fdopen(fd, 'wb') as spool:
+                    shutil.copyfileobj(f, spool, HASH_BLOCK_SIZE)
+                return spool_path
+            yield name, member.size, int(member.mtime) * 1_000_000_000, load
+
+def find_near_duplicates(inputs, workers=1, threshold=NEAR_DUP_THRESHOLD, json_backend="auto", sniff=False):
+    """
+    Find clusters of near-duplicate conversations among batch inputs
+    
+    Every input is read and signed (in parallel) and the signatures are
+    clustered with cluster_near_duplicates. Clusters are chained by single
+    linkage, so a member can be similar to another member but not to the
+    most complete one. Each cluster is therefore split greedily: the most
+    complete remaining variant (most messages, then most words, then first
+    in input order) is kept, the remaining members at or above threshold
+    against it are marked as its near-duplicates, and so on until every
+    member is either kept or marked.
+    
+    Args:
+        inputs (iterable): (name, input path, load) tuples as produced for
+            process_directory, where load() returns the _convert_file source
+        workers (int): Number of worker processes
+        threshold (float): Minimum estimated Jaccard similarity
+        json_backend (str): JSON implementation, see get_json_backend
+        sniff (bool): Leave out files that don't look like AIStudio prompts
+        
+    Returns:
+        list: One dict per cluster with the names to keep and the members
+        (name, messages, words, the kept variant they belong to, similarity
+        to it and whether they are its near-duplicate), each kept variant
+        followed by its near-duplicates
+    """
+    names = {}
+    spooled = {}
+    def tasks():
+        for name, input_path, load in inputs:
+            names[input_path] = name
+            source = load()
+            if isinstance(source, str):
+                spooled[input_path] = source
+            yield input_path, {"source": source, "json_backend": json_backend, "sniff": sniff}
+    
+    signed = {}
+    for input_path, result in _run_tasks(_signature_task, tasks(), workers):
+        if input_path in spooled:
+            os.remove(spooled.pop(input_path))
+        if result is not None and result["signature"] is not None:
+            signed[names[input_path]] = result
+    
+    clusters = []
+    for cluster in cluster_near_duplicates({name: result["signature"] for name, result in signed.items()},
+                                           threshold=threshold):
+        remaining = sorted(cluster, key=lambda name: (-signed[name]["messages"], -signed[name]["words"]))
+        keep = []
+        members = []
+        while remaining:
+            kept = remaining.pop(0)
+            keep.append(kept)
+            rest = []
+            for name in [kept] + remaining:
+                similarity = signature_similarity(signed[kept]["signature"], signed[name]["signature"])
+                if name != kept and similarity < threshold:
+                    rest.append(name)
+                    continue
+                members.append({"input": name, "messages": signed[name]["messages"],
+                                "words": signed[name]["words"], "kept_variant": kept,
+                                "similarity": round(similarity, 3), "near_duplicate": name != kept})
+            remaining = rest
+        clusters.append({"keep": keep, "members": members})
+    return clusters
+
+def find_branch_groups(inputs, workers=1, json_backend="auto", sniff=False):
+    """
+    Group batch inputs that start with the same chunks
+    
+    Inputs sharing their first MERGE_PREFIX_CHUNKS chunks other than
+    thoughts are variants of one conversation that can be merged into a
+    branched chat by convert_aistudio_branches. Sharing a prefix is an
+    equivalence, so groups never chain unrelated inputs together. Only
+    the start of each file is decoded when it is streamed.
+    
+    Args:
+        inputs (iterable): (name, input path, load) tuples as produced for
+            process_directory, where load() returns the _convert_file source;
+            tar archives are not supported
+        workers (int): Number of worker processes
+        json_backend (str): JSON implementation, see get_json_backend
+        sniff (bool): Leave out files that don't look like AIStudio prompts
+        
+    Returns:
+        list: Groups of two or more (name, input path, source) tuples, in
+        input order
+    """
+    members = {}
+    def tasks():
+        for name, input_path, load in inputs:
+            source = load()
+            members[input_path] = (name, input_path, source)
+            yield input_path, {"source": source, "json_backend": json_backend, "sniff": sniff}
+    
+    groups = {}
+    for input_path, prefix in _run_tasks(_prefix_task, tasks(), workers):
+        if prefix is not None:
+            groups.setdefault(prefix, []).append(members[input_path])
+    return [group for group in groups.values() if len(group) > 1]
+
+def process_directory(input_dir, output_dir, workers=None, compact=False,
+                      bundle=False, bundle_max_size=None, incremental=False,
+                      stable_ids=False, sqlite_path=None, user_id=None,
+                      api_url=None, api_key=None, api_concurrency=API_CONCURRENCY,
+                      json_backend="auto", blob_dir=None, blob_url_prefix="",
+                      takeout_dir=None, drive_index=None, rebuild_drive_index=False,
+                      recursive=False, include=None, exclude=None, compression=None,
+                      compress_level=None, compress_threads=0, sniff=True, log_path=None,
+                      history_only=False, catalog_path=None, search_index_path=None, dedup=False,
+                      near_dups=None, near_dup_threshold=None, merge_branches=False):
+    """
+    Process all AIStudio files in a directory and convert them to OpenWebUI format
+    
+    input_dir may also be a zip or tar archive, which is read without
+    extracting it (see iter_archive_members).
+    
+    A manifest of converted inputs (size, mtime, content hash, output file
+    and chat IDs) is kept in output_dir after every run. Inputs are keyed by
+    their path relative to input_dir. While a run is in progress, every
+    completed input is also appended to a journal (JOURNAL_NAME) that is
+    removed when the run finishes; a run that finds the journal of an
+    interrupted run with the same settings skips the inputs recorded in it
+    if they are unchanged. Bundles are always rebuilt in full.
+    
+    Args:
+        input_dir (str): Path to directory or archive containing AIStudio files
+        output_dir (str): Path to directory for output OpenWebUI JSON files
+        workers (int): Number of worker processes (defaults to CPU count)
+        compact (bool): Write compact JSON instead of indented JSON
+        bundle (bool): Write all chats into a single OpenWebUI import file
+            instead of one file per input
+        bundle_max_size (int): Split the bundle into shards of at most this
+            many bytes
+        incremental (bool): Skip inputs the manifest shows as unchanged since
+            the last run; in bundle mode the bundle then only holds new and
+            modified chats
+        stable_ids (bool): Derive chat and message IDs from file names and
+            contents
+        sqlite_path (str): Insert chats straight into the chat table of this
+            OpenWebUI database instead of writing JSON files
+        user_id (str): OpenWebUI user that owns the inserted chats
+        api_url (str): Upload chats to the OpenWebUI instance at this base
+            URL instead of writing JSON files; uploads are checkpointed in
+            output_dir and not repeated for unchanged inputs
+        api_key (str): OpenWebUI API key for uploads
+        api_concurrency (int): Number of concurrent uploads
+        json_backend (str): JSON implementation, see get_json_backend
+        blob_dir (str): Extract inline images into this content-addressed
+            store, shared by all chats in the batch
+        blob_url_prefix (str): Prefix for blob URLs in the output
+        takeout_dir (str): Attach Drive documents and images referenced by
+            chats from this local Takeout tree
+        drive_index (str): Where the Drive index is kept (defaults to
+            output_dir)
+        rebuild_drive_index (bool): Rescan takeout_dir even if an index exists
+        recursive (bool): Also convert files in subdirectories, mirroring
+            the directory layout in output_dir
+        include (list): Only convert files matching one of these globs
+        exclude (list): Skip files and directories matching these globs
+        compression (str): Write gzip or zstd compressed output files (or
+            bundles), see open_output
+        compress_level (int): Compression level
+        compress_threads (int): zstd compression threads per worker
+        sniff (bool): Skip files whose first few KB don't look like an
+            AIStudio prompt instead of trying to convert them
+        log_path (str): Write a JSONL results log (see ResultsLog) here;
+            per-file success lines are then not printed
+        history_only (bool): Leave out the chat.messages copy of the messages
+        catalog_path (str): Record every converted chat in an indexed
+            SQLite catalog at this path, see CatalogWriter
+        search_index_path (str): Build a full-text index of the converted
+            messages at this path, see SearchIndexWriter
+        dedup (bool): Convert each distinct conversation (see
+            conversation_key) only once; later copies are reported as
+            duplicates of the first and recorded in the manifest
+        near_dups (str): "report" to look for near-duplicate conversations
+            first (see find_near_duplicates) and write the clusters to
+            NEAR_DUP_REPORT_NAME in output_dir, "best" to also skip the
+            near-duplicates of the most complete variant of each cluster
+        near_dup_threshold (float): Minimum estimated Jaccard similarity of
+            near-duplicates; None for NEAR_DUP_BEST_THRESHOLD with "best"
+            and NEAR_DUP_THRESHOLD otherwise
+        merge_branches (bool): Merge inputs that start with the same chunks
+            (see find_branch_groups) into one branched chat, named after the
+            first of them; not supported for tar archives
+    """
+    if merge_branches and input_dir.lower().endswith(TAR_SUFFIXES):
+        raise ValueError("Merging branches needs random access to the inputs, which tar archives don't allow")
+    
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    
+    if workers is None:
+        workers = os.cpu_count() or 1
+    
+    # Index the Takeout tree once up front; workers only read the index
+    if takeout_dir is not None:
+        if drive_index is None:
+            drive_index = os.path.join(output_dir, DRIVE_INDEX_NAME)
+        index = load_drive_index(takeout_dir, drive_index, rebuild=rebuild_drive_index)
+        _drive_indexes[drive_index] = index
+        print(f"Drive index: {len(index)} files in {takeout_dir}")
+    
+    previous_manifest = load_manifest(output_dir)
+    manifest = {}
+    
+    # In bundle mode workers write each chat to a scratch file that is
+    # appended to the bundle in input order
+    options = {"compact": compact, "element": bundle, "stable_ids": stable_ids,
+               "row": sqlite_path is not None or api_url is not None,
+               "json_backend": get_json_backend(json_backend).name,
+               "blob_dir": blob_dir, "blob_url_prefix": blob_url_prefix,
+               "takeout_dir": takeout_dir, "drive_index": drive_index, "sniff": sniff,
+               "history_only": history_only, "catalog": catalog_path is not None,
+               "search": search_index_path is not None}
+    per_file = not bundle and not options["row"]
+    if per_file:
+        options.update(compression=compression, compress_level=compress_level,
+                       compress_threads=compress_threads)
+    
+    if near_dup_threshold is None:
+        near_dup_threshold = NEAR_DUP_BEST_THRESHOLD if near_dups == "best" else NEAR_DUP_THRESHOLD
+    
+    # Resume the interrupted run that left a journal, if it had the same settings
+    journal_file = None
+    resumed = {}
+    if not bundle:
+        settings = dict(options, json_backend=None, input_dir=os.path.abspath(input_dir),
+                        sqlite_path=sqlite_path, user_id=user_id, api_url=api_url,
+                        recursive=recursive, include=include, exclude=exclude,
+                        catalog_path=catalog_path, search_index_path=search_index_path, dedup=dedup,
+                        near_dups=near_dups, near_dup_threshold=near_dup_threshold,
+                        merge_branches=merge_branches)
+        journal_path = os.path.join(output_dir, JOURNAL_NAME)
+        resumed = load_journal(output_dir, settings)
+        if resumed is None:
+            if os.path.exists(journal_path):
+                print("Not resuming the interrupted run in this directory, its settings were different")
+            resumed = {}
+            journal_file = open(journal_path, 'w', encoding='utf-8')
+            journal_file.write(json.dumps({"settings": settings}) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        else:
+            if resumed:
+                print(f"Resuming an interrupted run, {len(resumed)} inputs already done")
+            journal_file = open(journal_path, 'a', encoding='utf-8')
+        previous_manifest.update(resumed)
+    journal_pending = []
+    journal_time = time.monotonic()
+    if sqlite_path is not None:
+        chat_writer = SQLiteChatWriter(sqlite_path, user_id)
+    if catalog_path is not None:
+        catalog_writer = CatalogWriter(catalog_path)
+    if search_index_path is not None:
+        search_writer = SearchIndexWriter(search_index_path)
+    journal_commits = [0] * ((sqlite_path is not None) + (catalog_path is not None)
+                             + (search_index_path is not None))
+    if api_url is not None:
+        uploader = OpenWebUIUploader(api_url, api_key, concurrency=api_concurrency)
+        uploaded = load_upload_checkpoint(output_dir)
+        checkpoint = open(os.path.join(output_dir, UPLOAD_CHECKPOINT_NAME), 'a', encoding='utf-8')
+        pending_uploads = deque()
+    if bundle:
+        scratch_dir = tempfile.mkdtemp(prefix='.bundle-', dir=output_dir)
+        bundle_writer = BundleWriter(output_dir, compact=compact, max_size=bundle_max_size,
+                                     compression=compression, compress_level=compress_level,
+                                     compress_threads=compress_threads)
+    
+    # Workers claim conversations in a shared scratch directory
+    if dedup:
+        options["dedup_dir"] = tempfile.mkdtemp(prefix='.dedup-', dir=output_dir)
+    
+    # Per-file results go to the log instead of stdout when there is one
+    results_log = ResultsLog(log_path) if log_path is not None else None
+    
+    def report(input_path, status, output_path=None, result=None, error=None, message=None):
+        if results_log is not None:
+            results_log.add(input_path, status, output_path, result, error)
+        if message is not None and (results_log is None or status == "error"):
+            print(message)
+    
+    def database_commits():
+        # Transactions committed so far by each database writer
+        commits = []
+        if sqlite_path is not None:
+            commits.append(chat_writer.commit_count)
+        if catalog_path is not None:
+            commits.append(catalog_writer.commit_count)
+        if search_index_path is not None:
+            commits.append(search_writer.commit_count)
+        return commits
+    
+    def journal(filename, entry):
+        # Record a completed input; records are synced in groups, and chats
+        # queued for a database only count once committed, so they wait until
+        # a writer commits its batch (when the others are committed too) or
+        # for the next checkpoint
+        nonlocal journal_time, journal_commits
+        manifest[filename] = entry
+        if journal_file is None:
+            return
+        journal_pending.append(json.dumps({"input": filename, "entry": entry}) + '\n')
+        if database_commits() == journal_commits and time.monotonic() - journal_time < JOURNAL_INTERVAL:
+            return
+        if sqlite_path is not None:
+            chat_writer.flush()
+        if catalog_path is not None:
+            catalog_writer.flush()
+        if search_index_path is not None:
+            search_writer.flush()
+        write_journal()
+        journal_time = time.monotonic()
+        journal_commits = database_commits()
+    
+    def write_journal():
+        journal_file.writelines(journal_pending)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+        journal_pending.clear()
+    
+    # Work items are produced in a stable order so runs are reproducible
+    success_count = 0
+    error_count = 0
+    unchanged_count = 0
+    skipped_count = 0
+    blobs_written = 0
+    blobs_reused = 0
+    drive_found = 0
+    drive_missing = 0
+    duplicate_count = 0
+    originals = {}
+    dedup_tasks = {}
+    near_duplicates = {}
+    merged_count = 0
+    branch_groups = {}
+    merged_into = {}
+    member_sizes = {}
+    stats = {}
+    
+    # Tar members too large to pass on in memory are spooled to disk
+    archive = is_archive(input_dir)
+    spool_dir = None
+    spooled = {}
+    if archive and input_dir.lower().endswith(TAR_SUFFIXES):
+        spool_dir = tempfile.mkdtemp(prefix='.archive-', dir=output_dir)
+    
+    def iter_inputs():
+        # (relative path, input path, size, mtime_ns, load) for every input,
+        # where load() returns the source for _convert_file
+        if archive:
+            for filename, size, mtime_ns, load in iter_archive_members(input_dir, include=include,
+                                                                       exclude=exclude, spool_dir=spool_dir):
+                yield filename, os.path.join(input_dir, *filename.split('/')), size, mtime_ns, load
+            return
+        for filename, dir_entry in iter_input_files(input_dir, recursive=recursive, include=include,
+                                                    exclude=exclude, skip_dirs=[output_dir]):
+            stat = dir_entry.stat()
+            yield filename, dir_entry.path, stat.st_size, stat.st_mtime_ns, lambda: None
+    
+    def per_file_output(filename):
+        # Output file of an input (always with a .json extension), mirroring
+        # the input's subdirectory
+        if filename.endswith('.json'):
+            output_filename = filename
+        else:
+            output_filename = filename + '.json'
+        output_filename += COMPRESSION_SUFFIXES.get(compression, '')
+        return os.path.join(output_dir, *output_filename.split('/'))
+    
+    def discover_tasks():
+        # Yield conversion tasks while the input tree is still being read
+        nonlocal unchanged_count, duplicate_count
+        task_count = 0
+        # Process all files (AIStudio files don't necessarily have .json extension)
+        for filename, input_path, size, mtime_ns, load in iter_inputs():
+            if options["row"]:
+                output_path = None
+            elif bundle:
+                output_path = os.path.join(scratch_dir, f"{task_count:08d}.part")
+            else:
+                output_path = per_file_output(filename)
+                if '/' in filename:
+                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            
+            stats[input_path] = (filename, size, mtime_ns)
+            
+            # Later variants of a branched chat are converted with the first
+            if filename in merged_into:
+                continue
+            
+            # Near-duplicates of a more complete variant are not converted
+            if filename in near_duplicates:
+                keep = near_duplicates[filename]
+                if per_file and os.path.exists(output_path):
+                    os.remove(output_path)
+                manifest[filename] = {"size": size, "mtime_ns": mtime_ns, "sha256": None, "output": None,
+                                      "chat_ids": [], "duplicate_of": keep, "near_duplicate": True}
+                duplicate_count += 1
+                report(input_path, "duplicate", result={"bytes_in": size, "duplicate_of": keep},
+                       message=f"Skipped {input_path}: near-duplicate of {keep}")
+                continue
+            
+            # Never upload the same version of a file twice
+            if api_url is not None and (filename, size, mtime_ns) in uploaded:
+                if filename in previous_manifest:
+                    manifest[filename] = previous_manifest[filename]
+                unchanged_count += 1
+                report(input_path, "unchanged", api_url, {"bytes_in": size})
+                for member, member_path, _ in branch_groups.get(filename, ())[1:]:
+                    if member in previous_manifest:
+                        manifest[member] = previous_manifest[member]
+                    unchanged_count += 1
+                    report(member_path, "unchanged", api_url, {"bytes_in": member_sizes[member][0]})
+                continue
+            
+            # Compare against the previous run: identical size and mtime means
+            # unchanged, identical size alone is settled by the content hash
+            task_options = options
+            previous = previous_manifest.get(filename)
+            if previous is not None and previous.get("duplicate_of") is not None:
+                # A duplicate stays one only while its original is unchanged;
+                # near-duplicates are found afresh on every run
+                original = previous["duplicate_of"]
+                if previous.get("near_duplicate") or \
+                        manifest.get(original, _MISSING) is not previous_manifest.get(original):
+                    previous = None
+            # Branched chats are always rebuilt from all their variants
+            if previous is not None and (previous.get("merged") or previous.get("merged_into")
+                                         or filename in branch_groups):
+                previous = None
+            if (incremental or filename in resumed) and previous is not None and previous["size"] == size \
+                    and (not per_file or previous.get("duplicate_of") is not None
+                         or os.path.exists(output_path)):
+                if previous["mtime_ns"] == mtime_ns:
+                    manifest[filename] = previous
+                    if dedup and previous.get("dedup_key") is not None:
+                        originals.setdefault(previous["dedup_key"], filename)
+                    unchanged_count += 1
+                    report(input_path, "unchanged", output_path, {"bytes_in": size})
+                    continue
+                task_options = dict(options, known_sha256=previous["sha256"])
+            
+            # Archive members are read from the archive or handed over directly
+            source = load()
+            if source is not None:
+                task_options = dict(task_options, source=source)
+                if isinstance(source, str):
+                    spooled[input_path] = source
+            
+            if stable_ids:
+                task_options = dict(task_options, name=filename)
+            if dedup:
+                task_options = dict(task_options, dedup_index=task_count)
+                dedup_tasks[input_path] = task_options
+            if filename in branch_groups:
+                task_options = dict(task_options, branches=[(member_path, member_source) for _, member_path,
+                                                            member_source in branch_groups[filename][1:]])
+            
+            task_count += 1
+            yield input_path, output_path, task_options
+    
+    def finish_upload(input_path, entry, result, futures):
+        # Wait for all chats of one input; record it only if every upload succeeded
+        nonlocal success_count, error_count
+        try:
+            responses = [future.result() for future in futures]
+        except Exception as e:
+            report(input_path, "error", api_url, dict(result, error_type=type(e).__name__), str(e),
+                   message=f"Error uploading {input_path}: {e}")
+            error_count += 1
+            return
+        filename, size, mtime_ns = stats[input_path]
+        remote_ids = [response.get("id") for response in responses]
+        checkpoint.write(json.dumps({"input": filename, "size": size, "mtime_ns": mtime_ns,
+                                     "remote_id": remote_ids[0] if remote_ids else None}) + '\n')
+        checkpoint.flush()
+        journal(filename, entry)
+        report(input_path, "uploaded", api_url, result, message=f"Successfully uploaded {input_path}")
+        success_count += 1
+    
+    # Process the files, reporting in input order
+    completed = False
+    try:
+        # Cluster near-duplicates in a pass over all inputs of their own
+        if near_dups is not None:
+            clusters = find_near_duplicates(((filename, input_path, load)
+                                             for filename, input_path, _, _, load in iter_inputs()),
+                                            workers, threshold=near_dup_threshold,
+                                            json_backend=options["json_backend"], sniff=sniff)
+            report_path = os.path.join(output_dir, NEAR_DUP_REPORT_NAME)
+            with open(report_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({"threshold": near_dup_threshold, "clusters": clusters}, f, ensure_ascii=False, indent=2)
+            _replace_durably(report_path + '.tmp', report_path)
+            print(f"Found {len(clusters)} near-duplicate clusters "
+                  f"({sum(len(cluster['members']) for cluster in clusters)} files), see {report_path}")
+            if near_dups == "best":
+                # Every kept variant is converted, its near-duplicates are
+                # skipped
+                near_duplicates = {member["input"]: member["kept_variant"] for cluster in clusters
+                                   for member in cluster["members"] if member["near_duplicate"]}
+                independent = sum(len(cluster["keep"]) - 1 for cluster in clusters)
+                if independent:
+                    print(f"Converting {independent} more clustered files that are below the threshold "
+                          f"against their cluster's most complete variant")
+        
+        # Group the variants to merge into branched chats in a pass of their own
+        if merge_branches:
+            def branch_inputs():
+                for filename, input_path, size, mtime_ns, load in iter_inputs():
+                    member_sizes[filename] = (size, mtime_ns)
+                    yield filename, input_path, load
+            for group in find_branch_groups(branch_inputs(), workers, json_backend=options["json_backend"],
+                                            sniff=sniff):
+                branch_groups[group[0][0]] = group
+                for member, _, _ in group[1:]:
+                    merged_into[member] = group[0][0]
+            print(f"Merging {len(merged_into) + len(branch_groups)} files into {len(branch_groups)} branched chats")
+        
+        for input_path, output_path, error, result in _run_tasks(_convert_task, discover_tasks(), workers):
+            filename, size, mtime_ns = stats[input_path]
+            
+            # A copy of a conversation whose first input failed to convert
+            # takes its place, converted here without the claim check
+            if dedup:
+                task_options = dedup_tasks.pop(input_path)
+                if error is None and result.get("duplicate") and result["duplicate"] not in originals:
+                    dedup_key = result["duplicate"]
+                    _, _, error, result = _convert_task((input_path, output_path, dict(task_options, dedup_dir=None)))
+                    if error is None:
+                        result["dedup_key"] = dedup_key
+            if input_path in spooled:
+                os.remove(spooled.pop(input_path))
+            if error is not None:
+                report(input_path, "error", output_path if per_file else None, dict(result, bytes_in=size),
+                       error, message=f"Error converting {input_path}: {error}")
+                error_count += 1
+                for member, member_path, _ in branch_groups.get(filename, ())[1:]:
+                    report(member_path, "error", None, dict(result, bytes_in=member_sizes[member][0]),
+                           error, message=f"Error converting {member_path}: {error}")
+                    error_count += 1
+                continue
+            if "timings" in result:
+                record_phase_timings(result["timings"])
+            
+            if result.get("unchanged"):
+                journal(filename, dict(previous_manifest[filename], mtime_ns=mtime_ns))
+                # Copies of a chat that was converted before are still duplicates
+                if dedup and manifest[filename].get("dedup_key") is not None:
+                    originals.setdefault(manifest[filename]["dedup_key"], filename)
+                unchanged_count += 1
+                report(input_path, "unchanged", output_path if per_file else None, result)
+                continue
+            
+            if result.get("skipped"):
+                report(input_path, "skipped", result=result,
+                       message=f"Skipped {input_path}: not an AIStudio prompt")
+                skipped_count += 1
+                continue
+            
+            # The first input converted with a conversation is its original;
+            # later ones are dropped, including any converted before their
+            # claim was seen
+            if dedup:
+                dedup_key = result.get("duplicate") or result["dedup_key"]
+                original = originals.get(dedup_key)
+                if original is not None:
+                    if output_path is not None and os.path.exists(output_path):
+                        os.remove(output_path)
+                    journal(filename, {"size": size, "mtime_ns": mtime_ns, "sha256": result["sha256"],
+                                       "output": None, "chat_ids": [], "duplicate_of": original})
+                    duplicate_count += 1
+                    report(input_path, "duplicate", result={"bytes_in": size, "duplicate_of": original},
+                           message=f"Skipped {input_path}: duplicate of {original}")
+                    continue
+                originals[dedup_key] = filename
+            
+            blobs_written += result.get("blobs_written", 0)
+            blobs_reused += result.get("blobs_reused", 0)
+            drive_found += result.get("drive_found", 0)
+            drive_missing += result.get("drive_missing", 0)
+            
+            entry = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "sha256": result["sha256"],
+                "output": os.path.relpath(output_path, output_dir) if per_file else None,
+                "chat_ids": result["chat_ids"]
+            }
+            if dedup:
+                entry["dedup_key"] = dedup_key
+            
+            # Record the variants merged into this chat
+            if filename in branch_groups:
+                destination = output_path if per_file else sqlite_path or api_url
+                entry["merged"] = []
+                for member, member_path, _ in branch_groups[filename][1:]:
+                    # Grouping is a heuristic, so an output of the variant's
+                    # own from an earlier run is kept, but pointed out
+                    message = f"Merged {member_path} into the chat of {input_path}"
+                    if per_file and os.path.exists(per_file_output(member)):
+                        message += (f"; {per_file_output(member)} from an earlier run repeats its messages, "
+                                    f"remove it before importing")
+                    member_size, member_mtime_ns = member_sizes[member]
+                    manifest[member] = {"size": member_size, "mtime_ns": member_mtime_ns, "sha256": None,
+                                        "output": entry["output"], "chat_ids": result["chat_ids"],
+                                        "merged_into": filename}
+                    entry["merged"].append(member)
+                    merged_count += 1
+                    report(member_path, "merged", destination, {"bytes_in": member_size}, message=message)
+            if catalog_path is not None:
+                catalog_writer.add(dict(result.pop("catalog"), source=filename, sha256=result["sha256"],
+                                        messages=result["messages"], bytes_in=size,
+                                        bytes_out=result["bytes_out"], modified_at=mtime_ns // 10**9,
+                                        converted_at=int(time.time()), output=entry["output"]))
+            if search_index_path is not None:
+                search = result.pop("search", None)
+                if search is not None:
+                    search_writer.add(filename, result["chat_ids"][0], search["title"], search["messages"])
+            if api_url is not None:
+                # Keep a bounded number of uploads in flight
+                futures = [uploader.submit(_import_body(row)) for row in result.pop("rows")]
+                pending_uploads.append((input_path, entry, result, futures))
+                while len(pending_uploads) > api_concurrency * 2:
+                    finish_upload(*pending_uploads.popleft())
+                continue
+            
+            if sqlite_path is not None:
+                for row in result["rows"]:
+                    chat_writer.add(row)
+                report(input_path, "converted", sqlite_path, result,
+                       message=f"Successfully converted {input_path}")
+            elif bundle:
+                bundle_writer.add(output_path)
+                os.remove(output_path)
+                report(input_path, "converted", bundle_writer.paths[-1] if bundle_writer.paths else None,
+                       result, message=f"Successfully converted {input_path}")
+            else:
+                report(input_path, "converted", output_path, result,
+                       message=f"Successfully converted {input_path} to {output_path}")
+            success_count += 1
+            journal(filename, entry)
+        
+        if api_url is not None:
+            while pending_uploads:
+                finish_upload(*pending_uploads.popleft())
+        completed = True
+    finally:
+        _close_archives()
+        if dedup:
+            shutil.rmtree(options["dedup_dir"], ignore_errors=True)
+        if spool_dir is not None:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+        if bundle:
+            if completed:
+                bundle_writer.close()
+            else:
+                bundle_writer.abort()
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        if sqlite_path is not None:
+            chat_writer.close()
+        if catalog_path is not None:
+            catalog_writer.close()
+        if search_index_path is not None:
+            search_writer.close()
+        if api_url is not None:
+            uploader.close()
+            checkpoint.close()
+        # An interrupted run leaves the manifest alone and its journal behind
+        if completed:
+            save_manifest(output_dir, manifest)
+        if journal_file is not None:
+            if journal_pending:
+                write_journal()
+            journal_file.close()
+            if completed:
+                os.remove(journal_path)
+        if results_log is not None:
+            log_summary = results_log.close()
+    
+    if bundle:
+        for path in bundle_writer.paths:
+            print(f"Wrote bundle {path}")
+    if sqlite_path is not None:
+        print(f"Inserted {chat_writer.chat_count} chats into {sqlite_path}")
+        if chat_writer.replaced_count:
+            print(f"Warning: {chat_writer.replaced_count} chats had the ID of a chat inserted earlier in this run "
+                  f"and replaced it")
+    if catalog_path is not None:
+        print(f"Cataloged {catalog_writer.chat_count} chats in {catalog_path}")
+    if search_index_path is not None:
+        print(f"Indexed {search_writer.message_count} messages from {search_writer.chat_count} chats "
+              f"in {search_index_path}")
+        if search_writer.replaced_count:
+            print(f"Warning: {search_writer.replaced_count} chats indexed earlier in this run were replaced "
+                  f"by chats with the same ID")
+    if blob_dir is not None:
+        print(f"Extracted {blobs_written + blobs_reused} attachments to {blob_dir} "
+              f"({blobs_written} new, {blobs_reused} already stored)")
+    if takeout_dir is not None:
+        print(f"Attached {drive_found} Drive files from {takeout_dir} "
+              f"({drive_missing} references not found)")
+    summary = f"Conversion complete: {success_count} successful, {error_count} errors"
+    if incremental or api_url is not None or resumed:
+        summary += f", {unchanged_count} unchanged"
+    if skipped_count:
+        summary += f", {skipped_count} skipped (not AIStudio files)"
+    if dedup or near_dups == "best":
+        summary += f", {duplicate_count} duplicates"
+    if merge_branches:
+        summary += f", {merged_count} merged into branched chats"
+    print(summary)
+    if results_log is not None:
+        seconds = log_summary["seconds"]
+        print(f"Throughput: {log_summary['messages']} messages, "
+              f"{log_summary['bytes_in'] / (1024 * 1024):.1f} MB in, "
+              f"{log_summary['bytes_out'] / (1024 * 1024):.1f} MB out in {seconds:.1f} s "
+              f"({success_count / seconds if seconds else 0:.1f} files/s)")
+        if log_summary["error_types"]:
+            print("Errors by type: " + ", ".join(
+                f"{name} {count}" for name, count in sorted(log_summary["error_types"].items(),
+                                                          key=lambda item: -item[1])))
+        print(f"Results log written to {log_path}")
+    return success_count, error_count
+
+def record_phase_timings(timings):
+    """Add one converted input's phase timings (see _convert_file) to the profile breakdown"""
+    for phase, seconds in timings.items():
+        _phase_seconds[phase] += seconds
+
+def profile_phases():
+    """
+    Time spent per pipeline phase since the last call
+    
+    Phases are timed by _convert_file itself with explicit spans around
+    reading, parsing, converting, serializing and writing, and added up by
+    record_phase_timings as results come in, including those of worker
+    processes.
+    
+    Returns:
+        dict: Seconds per phase, in PROFILE_PHASES order
+    """
+    phases = dict(_phase_seconds)
+    for phase in _phase_seconds:
+        _phase_seconds[phase] = 0.0
+    return phases
+
+def profile_call(func, output_path, profiler="cprofile"):
+    """
+    Run func under a profiler and report where the time went
+    
+    With cProfile the raw profile is saved as a pstats dump and the most
+    expensive functions are printed. pyinstrument samples the stack
+    instead, which adds far less overhead; its report is saved as text.
+    Either way a breakdown of the conversion time by phase (see
+    profile_phases) follows, with the rest of the wall time (discovery,
+    process pool, manifest, ...) as other.
+    
+    Args:
+        func (callable): Work to profile
+        output_path (str): Where to save the profile
+        profiler (str): "cprofile" or "pyinstrument"
+    """
+    profile_phases()
+    start = time.perf_counter()
+    if profiler == "pyinstrument":
+        sampler = pyinstrument.Profiler()
+        sampler.start()
+        try:
+            func()
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - start
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(sampler.output_text(unicode=True))
+            print(f"Wrote sampling profile to {output_path}")
+            _print_phases(profile_phases(), elapsed)
+        return
+    
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(func)
+    finally:
+        elapsed = time.perf_counter() - start
+        profile.dump_stats(output_path)
+        stats = pstats.Stats(profile)
+        print("Top functions by own time:")
+        top = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:10]
+        for (filename, line, name), (_, calls, own_time, _, _) in top:
+            location = f"{os.path.basename(filename)}:{line}" if filename != '~' else "built-in"
+            print(f"  {own_time:8.3f} s  {calls:>9} calls  {name} ({location})")
+        print(f"Wrote profile to {output_path} (inspect with: python -m pstats {output_path})")
+        _print_phases(profile_phases(), elapsed)
+
+def _print_phases(phases, elapsed):
+    """Print a per-phase breakdown of a run that took elapsed seconds"""
+    # Worker processes convert in parallel, so their phases can add up to
+    # more than the wall time
+    phases["other"] = max(0.0, elapsed - sum(phases.values()))
+    total = sum(phases.values())
+    print(f"Per-phase breakdown ({elapsed:.3f} s elapsed):")
+    for phase, seconds in phases.items():
+        share = seconds / total * 100 if total else 0.0
+        print(f"  {phase:<10} {seconds:8.3f} s  {share:5.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert AIStudio chat files to OpenWebUI format')
+    parser.add_argument('input', help='Input file, directory, or .zip/.tar(.gz) archive path')
+    parser.add_argument('output', help='Output file or directory path')
+    parser.add_argument('--batch', action='store_true', help='Process multiple files in batch mode')
+    parser.add_argument('--recursive', '-r', action='store_true',
+                        help='In batch mode, also convert files in subdirectories, mirroring them in the output')
+    parser.add_argument('--include', action='append', default=None, metavar='GLOB',
+                        help='In batch mode, only convert files matching this glob (repeatable), e.g. "*.json"')
+    parser.add_argument('--exclude', action='append', default=None, metavar='GLOB',
+                        help='In batch mode, skip files and directories matching this glob (repeatable)')
+    parser.add_argument('--no-sniff', dest='sniff', action='store_false',
+                        help='In batch mode, try to convert every file instead of skipping files that '
+                             'do not look like AIStudio prompts')
+    parser.add_argument('--log', metavar='PATH', default=None,
+                        help='Write a JSONL results log (one record per file plus a summary); in batch mode '
+                             'it replaces the line printed per converted file')
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help='Number of worker processes in batch mode (default: CPU count)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Write compact JSON without indentation (smaller output files)')
+    parser.add_argument('--history-only', action='store_true',
+                        help='Store messages only in chat.history, which is all OpenWebUI reads, leaving '
+                             'chat.messages empty (roughly halves output size)')
+    parser.add_argument('--bundle', action='store_true',
+                        help='In batch mode, write all chats into a single OpenWebUI import file')
+    parser.add_argument('--bundle-max-size', type=float, default=None, metavar='MB',
+                        help='Split the bundle into numbered files of at most this many megabytes')
+    parser.add_argument('--incremental', action='store_true',
+                        help='In batch mode, skip inputs unchanged since the last run into the same output directory')
+    parser.add_argument('--sqlite', metavar='PATH', default=None,
+                        help='In batch mode, insert chats directly into the chat table of an OpenWebUI webui.db')
+    parser.add_argument('--user-id', default=None,
+                        help='OpenWebUI user ID that will own chats inserted with --sqlite')
+    parser.add_argument('--catalog', metavar='PATH', default=None,
+                        help='In batch mode, record every converted chat (title, model, message counts, '
+                             'sizes, dates) in an indexed SQLite catalog at PATH')
+    parser.add_argument('--dedup', action='store_true',
+                        help='In batch mode, convert identical conversations (same chunks, any file name) '
+                             'only once and report the copies as duplicates')
+    parser.add_argument('--near-dups', choices=('report', 'best'), default=None,
+                        help='In batch mode, find clusters of near-duplicate conversations (MinHash/LSH) and '
+                             f'list them in {NEAR_DUP_REPORT_NAME}; "best" also skips the near-duplicates of '
+                             'the most complete variant of each cluster')
+    parser.add_argument('--near-dup-threshold', type=float, default=None, metavar='SIMILARITY',
+                        help=f'Minimum Jaccard similarity of near-duplicates (default: {NEAR_DUP_THRESHOLD}, '
+                             f'{NEAR_DUP_BEST_THRESHOLD} with --near-dups best)')
+    parser.add_argument('--merge-branches', action='store_true',
+                        help='In batch mode, merge prompts that start with the same chunks (copies that were '
+                             'continued differently) into one chat with branches')
+    parser.add_argument('--search-index', metavar='PATH', default=None,
+                        help='In batch mode, build a SQLite FTS5 full-text index of message text and '
+                             'reasoning at PATH')
+    parser.add_argument('--api-url', metavar='URL', default=None,
+                        help='In batch mode, upload chats to the OpenWebUI instance at this base URL')
+    parser.add_argument('--api-key', default=os.environ.get('OPENWEBUI_API_KEY'),
+                        help='OpenWebUI API key for --api-url (default: $OPENWEBUI_API_KEY)')
+    parser.add_argument('--api-concurrency', type=int, default=API_CONCURRENCY, metavar='N',
+                        help=f'Number of concurrent uploads (default: {API_CONCURRENCY})')
+    parser.add_argument('--blob-dir', metavar='DIR', default=None,
+                        help='Extract inline images into this content-addressed directory and link them from messages')
+    parser.add_argument('--blob-url-prefix', default='', metavar='PREFIX',
+                        help='Prefix for attachment URLs, e.g. the address the blob directory is served from')
+    parser.add_argument('--takeout-dir', metavar='DIR', default=None,
+                        help='Attach Drive documents and images referenced by chats from this Google Takeout Drive folder')
+    parser.add_argument('--drive-index', metavar='PATH', default=None,
+                        help=f'Where to keep the Drive file index (default: {DRIVE_INDEX_NAME} in the output directory)')
+    parser.add_argument('--rebuild-drive-index', action='store_true',
+                        help='Rescan --takeout-dir even if a Drive index already exists')
+    parser.add_argument('--compress', choices=('gzip', 'zstd'), default=None,
+                        help='Write .json.gz or .json.zst output (default: plain JSON, or inferred from '
+                             'a .gz/.zst output file name)')
+    parser.add_argument('--compress-level', type=int, default=None, metavar='N',
+                        help='Compression level (default: 6 for gzip, 3 for zstd)')
+    parser.add_argument('--compress-threads', type=int, default=0, metavar='N',
+                        help='zstd compression threads per worker process (-1: one per CPU; default: 0)')
+    parser.add_argument('--json-backend', choices=('auto', 'orjson', 'ujson', 'json'), default='auto',
+                        help='JSON library for parsing and writing (default: fastest installed)')
+    parser.add_argument('--stable-ids', action='store_true',
+                        help='Derive chat and message IDs from file names and contents so reconversions keep '
+                             'the same IDs')
+    parser.add_argument('--profile', nargs='?', const=PROFILE_NAME, default=None, metavar='PATH',
+                        help=f'Profile the run, save the profile to PATH (default: {PROFILE_NAME}) and '
+                             'print a per-phase breakdown, which includes worker processes; the profile '
+                             'itself covers the main process only, so use --workers 1 to profile conversion')
+    parser.add_argument('--profiler', choices=('cprofile', 'pyinstrument'), default='cprofile',
+                        help='Profiler for --profile: cProfile (pstats dump and phase breakdown, default) '
+                             'or the pyinstrument sampling profiler (text report, lower overhead)')
+    
+    args = parser.parse_args()
+    
+    try:
+        get_json_backend(args.json_backend)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    
+    batch = args.batch or os.path.isdir(args.input) or is_archive(args.input)
+    if args.bundle_max_size is not None:
+        if args.bundle_max_size <= 0:
+            parser.error('--bundle-max-size must be positive')
+        args.bundle = True
+    if args.bundle and not batch:
+        parser.error('--bundle requires batch mode')
+    if args.sqlite is not None:
+        if not batch:
+            parser.error('--sqlite requires batch mode')
+        if args.bundle:
+            parser.error('--sqlite cannot be combined with --bundle')
+        if not args.user_id:
+            parser.error('--sqlite requires --user-id')
+    if args.catalog is not None and not batch:
+        parser.error('--catalog requires batch mode')
+    if args.search_index is not None and not batch:
+        parser.error('--search-index requires batch mode')
+    if args.dedup and not batch:
+        parser.error('--dedup requires batch mode')
+    if args.near_dups is not None and not batch:
+        parser.error('--near-dups requires batch mode')
+    if args.near_dup_threshold is not None and not 0 < args.near_dup_threshold <= 1:
+        parser.error('--near-dup-threshold must be between 0 and 1')
+    if args.merge_branches:
+        if not batch:
+            parser.error('--merge-branches requires batch mode')
+        if args.dedup or args.near_dups == 'best':
+            parser.error('--merge-branches cannot be combined with --dedup or --near-dups best')
+        if args.input.lower().endswith(TAR_SUFFIXES):
+            parser.error('--merge-branches does not support tar archives; extract them or use a zip')
+    if args.compress is None and not batch:
+        args.compress = next((name for name, suffix in COMPRESSION_SUFFIXES.items()
+                              if args.output.endswith(suffix)), None)
+    if args.compress is None and (args.compress_level is not None or args.compress_threads):
+        parser.error('--compress-level and --compress-threads require --compress')
+    if args.compress == 'gzip':
+        if args.compress_level is not None and not 0 <= args.compress_level <= 9:
+            parser.error('gzip --compress-level must be between 0 and 9')
+        if args.compress_threads:
+            parser.error('--compress-threads is only supported with zstd')
+    if args.compress == 'zstd':
+        if zstandard is None:
+            parser.error('--compress zstd requires the zstandard package (pip install zstandard)')
+        if args.compress_level is not None and args.compress_level > 22:
+            parser.error('zstd --compress-level must be at most 22')
+    if args.compress is not None and (args.sqlite is not None or args.api_url is not None):
+        parser.error('--compress cannot be combined with --sqlite or --api-url')
+    if args.profile is not None:
+        if args.profiler == 'pyinstrument' and pyinstrument is None:
+            parser.error('--profiler pyinstrument requires the pyinstrument package (pip install pyinstrument)')
+        # Worker processes are invisible to the profiler, but report their
+        # phase timings for the breakdown
+        if batch and args.workers != 1:
+            print("Note: the profile covers the main process only, the phase breakdown includes the workers; "
+                  "use --workers 1 to profile the conversion itself")
+    if args.takeout_dir is not None and not os.path.isdir(args.takeout_dir):
+        parser.error(f'--takeout-dir {args.takeout_dir} is not a directory')
+    if (args.drive_index is not None or args.rebuild_drive_index) and args.takeout_dir is None:
+        parser.error('--drive-index and --rebuild-drive-index require --takeout-dir')
+    if args.api_url is not None:
+        if not batch:
+            parser.error('--api-url requires batch mode')
+        if args.bundle or args.sqlite is not None:
+            parser.error('--api-url cannot be combined with --bundle or --sqlite')
+        if args.api_concurrency < 1:
+            parser.error('--api-concurrency must be at least 1')
+    
+    def run():
+        if batch:
+            # Batch mode - process directory
+            process_directory(args.input, args.output, workers=args.workers, compact=args.compact,
+                              bundle=args.bundle, incremental=args.incremental, stable_ids=args.stable_ids,
+                              sqlite_path=args.sqlite, user_id=args.user_id,
+                              api_url=args.api_url, api_key=args.api_key, api_concurrency=args.api_concurrency,
+                              json_backend=args.json_backend,
+                              blob_dir=args.blob_dir, blob_url_prefix=args.blob_url_prefix,
+                              takeout_dir=args.takeout_dir, drive_index=args.drive_index,
+                              rebuild_drive_index=args.rebuild_drive_index,
+                              recursive=args.recursive, include=args.include, exclude=args.exclude,
+                              compression=args.compress, compress_level=args.compress_level,
+                              compress_threads=args.compress_threads, sniff=args.sniff, log_path=args.log,
+                              history_only=args.history_only, catalog_path=args.catalog,
+                              search_index_path=args.search_index, dedup=args.dedup,
+                              near_dups=args.near_dups, near_dup_threshold=args.near_dup_threshold,
+                              merge_branches=args.merge_branches,
+                              bundle_max_size=int(args.bundle_max_size * 1024 * 1024) if args.bundle_max_size else None)
+        else:
+            # Single file mode
+            process_file(args.input, args.output, compact=args.compact, stable_ids=args.stable_ids,
+                         json_backend=args.json_backend, blob_dir=args.blob_dir,
+                         blob_url_prefix=args.blob_url_prefix, takeout_dir=args.takeout_dir,
+                         drive_index=args.drive_index, rebuild_drive_index=args.rebuild_drive_index,
+                         compression=args.compress, compress_level=args.compress_level,
+                         compress_threads=args.compress_threads, log_path=args.log,
+                         history_only=args.history_only)
     
-    if args.batch or os.path.isdir(args.input):
-        # Batch mode - process directory
-        process_directory(args.input, args.output)
+    if args.profile is not None:
+        profile_call(run, args.profile, args.profiler)
     else:
-        # Single file mode
-        process_file(args.input, args.output)
+        run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
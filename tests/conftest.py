@@ -0,0 +1,24 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# The converter is a single script at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import convert_aistudio_to_openwebui as converter
+
+
+class _FixedDatetime(datetime):
+    """datetime whose now() is a fixed instant, for reproducible timestamps"""
+    
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 1, 1, 12, 0, 0, tzinfo=tz)
+
+
+@pytest.fixture
+def fixed_time(monkeypatch):
+    """Make chat and message timestamps independent of the wall clock"""
+    monkeypatch.setattr(converter, "datetime", _FixedDatetime)
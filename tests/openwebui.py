@@ -0,0 +1,106 @@
+"""
+Stand-ins for the parts of OpenWebUI that converted chats meet
+
+These mirror the frontend code that turns a chat's history into the list
+of messages shown, and serve the chat import API locally, so tests can
+check converted output and uploads without a running OpenWebUI instance.
+"""
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def create_messages_list(history, message_id):
+    """
+    Messages from the root to message_id, following parentId links
+    
+    Port of createMessagesList in OpenWebUI's src/lib/utils/index.ts,
+    which the chat view uses to display history.currentId's branch.
+    
+    Args:
+        history (dict): chat.history with messages and currentId
+        message_id (str): Last message of the branch
+        
+    Returns:
+        list: Messages in conversation order
+    """
+    if message_id is None:
+        return []
+    messages = []
+    while message_id is not None:
+        message = history["messages"][message_id]
+        messages.append(message)
+        message_id = message.get("parentId")
+    return messages[::-1]
+
+
+def displayed_messages(chat):
+    """Messages OpenWebUI shows for an imported chat: the current branch of its history"""
+    history = chat["history"]
+    return create_messages_list(history, history.get("currentId"))
+
+
+
+class ImportServer:
+    """
+    Local HTTP server standing in for OpenWebUI's chat import endpoint
+    
+    Every request is recorded. Responses are taken from a script of
+    (status, headers) pairs queued with respond(); once the script runs out
+    each import succeeds and returns a new chat ID. Connections are kept
+    alive like OpenWebUI's, so client connection reuse is exercised.
+    """
+    
+    def __init__(self):
+        self.requests = []
+        self._script = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.01},
+                                        daemon=True)
+    
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+    
+    def respond(self, status, headers=None, times=1):
+        """Answer the next requests with an HTTP status and headers"""
+        with self._lock:
+            self._script.extend([(status, headers or {})] * times)
+    
+    def _handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with server._lock:
+                    server.requests.append({"path": self.path, "headers": dict(self.headers),
+                                            "body": json.loads(body)})
+                    status, headers = server._script.popleft() if server._script else (200, {})
+                    chat_id = f"remote-{len(server.requests)}"
+                payload = json.dumps({"id": chat_id} if status == 200 else {"detail": "stand-in error"}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
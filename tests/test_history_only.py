@@ -0,0 +1,64 @@
+import json
+import random
+
+import benchmark
+import convert_aistudio_to_openwebui as converter
+from openwebui import displayed_messages
+
+
+def _write_prompt(path, prompt):
+    path.write_text(json.dumps(prompt), encoding="utf-8")
+
+
+def _chats(path):
+    return [item["chat"] for item in json.loads(path.read_text(encoding="utf-8"))]
+
+
+def test_history_only_displays_full_messages(tmp_path, fixed_time):
+    rng = random.Random(3)
+    for index in range(5):
+        input_path = tmp_path / f"prompt{index}"
+        _write_prompt(input_path, benchmark.generate_aistudio_prompt(rng, chunks=15, text_size=100))
+        full_path = tmp_path / f"full{index}.json"
+        history_path = tmp_path / f"history{index}.json"
+        assert converter.process_file(str(input_path), str(full_path), stable_ids=True)
+        assert converter.process_file(str(input_path), str(history_path), stable_ids=True, history_only=True)
+        
+        full, = _chats(full_path)
+        history_only, = _chats(history_path)
+        assert history_only["messages"] == []
+        assert full["messages"]
+        assert displayed_messages(history_only) == full["messages"]
+        assert history_only["history"] == full["history"]
+
+
+def test_history_only_branched_chat(tmp_path, fixed_time):
+    # Variants of one conversation merged into a branched chat (--merge-branches)
+    rng = random.Random(5)
+    chunks = benchmark.generate_aistudio_prompt(rng, chunks=10, text_size=50)["chunkedPrompt"]["chunks"]
+    variants = {
+        "a": chunks,
+        "b": chunks[:6] + [{"role": "user", "text": "another question"}, {"role": "model", "text": "answer"}],
+        "c": chunks + [{"role": "user", "text": "go on"}, {"role": "model", "text": "more"}],
+    }
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name, variant in variants.items():
+        _write_prompt(input_dir / name, {"runSettings": {"model": "models/x"}, "chunkedPrompt": {"chunks": variant}})
+    
+    outputs = {}
+    for history_only in (False, True):
+        output_dir = tmp_path / f"out-{history_only}"
+        converter.process_directory(str(input_dir), str(output_dir), workers=1, stable_ids=True,
+                                    merge_branches=True, history_only=history_only)
+        outputs[history_only] = _chats(output_dir / "a.json")[0]
+    full, history_only = outputs[False], outputs[True]
+    
+    # The history is a tree with a branch per variant, "c" (the longest) current
+    messages = full["history"]["messages"]
+    assert sum(1 for message in messages.values() if not message["childrenIds"]) == 2
+    assert [message["content"] for message in full["messages"][-2:]] == ["go on", "more"]
+    
+    assert history_only["messages"] == []
+    assert displayed_messages(full) == full["messages"]
+    assert displayed_messages(history_only) == full["messages"]
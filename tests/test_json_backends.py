@@ -0,0 +1,57 @@
+import json
+import random
+
+import pytest
+
+import benchmark
+import convert_aistudio_to_openwebui as converter
+
+BACKENDS = [
+    "json",
+    pytest.param("orjson", marks=pytest.mark.skipif(converter.orjson is None, reason="orjson not installed")),
+    pytest.param("ujson", marks=pytest.mark.skipif(converter.ujson is None, reason="ujson not installed")),
+]
+
+
+def _prompts():
+    """Synthetic prompts plus one with text the backends escape differently"""
+    rng = random.Random(7)
+    prompts = [benchmark.generate_aistudio_prompt(rng, chunks=12, text_size=200) for _ in range(5)]
+    prompts.append({
+        "runSettings": {"model": "models/gemini-2.5-pro", "temperature": 0.7, "topP": 0.95},
+        "chunkedPrompt": {"chunks": [
+            {"role": "user", "text": "Quotes \" backslash \\ slash / tab \t newline \n nul \u0000 bell \u0007"},
+            {"role": "model", "isThought": True, "text": "Separators \u2028 and \u2029, delete \u007f"},
+            {"role": "model", "text": "Emoji 😀, CJK 数据, combining e\u0301",
+             "parts": [{"text": "Emoji 😀"}, {"text": "more", "thought": True}]},
+            {"role": "user", "text": ""},
+            {"role": "model", "text": "x" * 10000},
+        ]}
+    })
+    return prompts
+
+
+def _convert(tmp_path, prompt, backend, compact):
+    input_path = tmp_path / "prompt"
+    input_path.write_text(json.dumps(prompt), encoding="utf-8")
+    output_path = tmp_path / f"{backend}-{compact}.json"
+    assert converter.process_file(str(input_path), str(output_path), compact=compact, stable_ids=True,
+                                  json_backend=backend)
+    return output_path.read_bytes()
+
+
+@pytest.mark.parametrize("compact", [False, True], ids=["indented", "compact"])
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_write_identical_bytes(tmp_path, fixed_time, backend, compact):
+    for prompt in _prompts():
+        expected = _convert(tmp_path, prompt, "json", compact)
+        assert _convert(tmp_path, prompt, backend, compact) == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_output_matches_stdlib_layout(tmp_path, fixed_time, backend):
+    # The streamed output is laid out exactly as json.dump would lay it out
+    prompt = _prompts()[-1]
+    for compact in (False, True):
+        output = _convert(tmp_path, prompt, backend, compact).decode("utf-8")
+        assert output == json.dumps(json.loads(output), **converter._json_options(compact))
@@ -0,0 +1,122 @@
+import io
+import json
+
+import pytest
+
+import convert_aistudio_to_openwebui as converter
+
+
+# Values whose numbers, literals and escapes straddle block boundaries at
+# every block size tried below
+VALUES = {
+    "numbers": [0, -0.5e-3, 1E+10, 12345678901234567890, -7, 3.25, 1e2],
+    "literals": [True, False, None, [True], {"a": None}],
+    "escapes": "quote \" backslash \\ slash / \b\f\n\r\t é   \U0001f600",
+    "nested": {"list": [[], {}, [1, [2, [3]]]], "empty": ""},
+}
+
+CHUNKS = [
+    {"text": "What is 2 + 2?", "role": "user", "tokenCount": 8},
+    {"text": "Adding \"two\" and two\n", "role": "model", "isThought": True, "tokenCount": 12},
+    {"text": "4", "role": "model", "finishReason": "STOP", "tokenCount": 1},
+    {"text": "And 10e3 \\ 7?", "role": "user"},
+]
+
+
+class _TrickleReader(io.StringIO):
+    """Text file that returns at most size characters per read"""
+    
+    def __init__(self, text, size):
+        super().__init__(text)
+        self.size = size
+    
+    def read(self, n=-1):
+        return super().read(self.size if n is None or n < 0 else min(n, self.size))
+
+
+def _document(*keys, indent=None):
+    parts = {
+        "runSettings": {"model": "models/gemini-2.5-pro", "temperature": 1.0, "topP": 0.95},
+        "systemInstruction": {"text": "Be brief — \"really\"."},
+        "chunkedPrompt": {"chunks": CHUNKS, "pendingInputs": [{"text": "", "role": "user"}]},
+        "values": VALUES,
+    }
+    return json.dumps({key: parts[key] for key in keys}, indent=indent)
+
+
+def _read(text, block, reopen=False):
+    aistudio_data = converter.read_aistudio_stream(
+        _TrickleReader(text, block), reopen=(lambda: _TrickleReader(text, block)) if reopen else None)
+    prompt = aistudio_data.get("chunkedPrompt")
+    if prompt is not None:
+        prompt["chunks"] = list(prompt["chunks"])
+    return aistudio_data
+
+
+@pytest.mark.parametrize("block", [1, 2, 3, 5, 8, 64])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_values_match_json_loads(block, indent):
+    text = json.dumps(VALUES, indent=indent, ensure_ascii=True)
+    assert converter._JSONStream(io.StringIO(text), block_size=block).value() == json.loads(text)
+    assert converter._JSONStream(_TrickleReader(text, block)).value() == json.loads(text)
+
+
+@pytest.mark.parametrize("block", [1, 3, 7])
+def test_skipped_values_are_consumed_whole(block):
+    text = json.dumps({"skip": VALUES, "keep": VALUES["numbers"]})
+    stream = converter._JSONStream(_TrickleReader(text, block))
+    found = {}
+    for key in stream.iter_object():
+        if key == "keep":
+            found[key] = stream.value()
+        else:
+            stream.skip()
+    stream.end()
+    assert found == {"keep": json.loads(text)["keep"]}
+
+
+@pytest.mark.parametrize("block", [1, 4, 16, converter.STREAM_BLOCK_SIZE])
+@pytest.mark.parametrize("reopen", [False, True])
+def test_settings_before_chunks(block, reopen):
+    text = _document("runSettings", "systemInstruction", "chunkedPrompt", "values", indent=2)
+    expected = json.loads(text)
+    expected["chunkedPrompt"] = {"chunks": expected["chunkedPrompt"]["chunks"]}
+    # Keys after chunkedPrompt are validated but not returned
+    del expected["values"]
+    assert _read(text, block, reopen) == expected
+
+
+@pytest.mark.parametrize("block", [1, 4, 16, converter.STREAM_BLOCK_SIZE])
+def test_settings_after_chunks_with_reopen(block):
+    text = _document("systemInstruction", "chunkedPrompt", "values", "runSettings")
+    expected = json.loads(text)
+    expected["chunkedPrompt"] = {"chunks": expected["chunkedPrompt"]["chunks"]}
+    del expected["values"]
+    assert _read(text, block, reopen=True) == expected
+
+
+@pytest.mark.parametrize("block", [1, 4, 16, converter.STREAM_BLOCK_SIZE])
+def test_settings_after_chunks_without_reopen(block):
+    # Without a second handle the whole document is read
+    text = _document("systemInstruction", "chunkedPrompt", "values", "runSettings")
+    assert _read(text, block) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", [
+    '',
+    '{"runSettings": {"model": "m"}',
+    '{"runSettings": {"model": "m"} "chunkedPrompt": {}}',
+    '{"runSettings": tru}',
+    '{"runSettings": 1.5.2}',
+    '{"runSettings": "\\x"}',
+    '{"chunkedPrompt": {"chunks": [{"text": "a"} {"text": "b"}]}}',
+    '{"chunkedPrompt": {"chunks": [{"text": "a"}]}, "runSettings": nul}',
+    '{"chunkedPrompt": {"chunks": []}} {}',
+    '{"chunkedPrompt": {"chunks": [{"text": "unterminated}]}}',
+])
+@pytest.mark.parametrize("block", [1, 5, converter.STREAM_BLOCK_SIZE])
+def test_malformed_input_raises_value_error(text, block):
+    with pytest.raises(ValueError):
+        json.loads(text)
+    with pytest.raises(ValueError):
+        _read(text, block)
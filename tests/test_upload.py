@@ -0,0 +1,109 @@
+import json
+import os
+import random
+
+import pytest
+
+import benchmark
+import convert_aistudio_to_openwebui as converter
+from openwebui import ImportServer
+
+
+@pytest.fixture
+def server():
+    with ImportServer() as server:
+        yield server
+
+
+@pytest.fixture
+def body(fixed_time):
+    prompt = benchmark.generate_aistudio_prompt(random.Random(1), chunks=4, text_size=50)
+    return converter._import_body(converter._chat_row(converter.convert_aistudio_stream(prompt, "chat")))
+
+
+def _uploader(server, **options):
+    return converter.OpenWebUIUploader(server.url, api_key="secret", backoff=0, **options)
+
+
+def test_upload_sends_chat(server, body):
+    uploader = _uploader(server)
+    try:
+        assert uploader.upload(body) == {"id": "remote-1"}
+    finally:
+        uploader.close()
+    request, = server.requests
+    assert request["path"] == converter.API_IMPORT_PATH
+    assert request["headers"]["Authorization"] == "Bearer secret"
+    assert request["body"] == json.loads(body)
+
+
+def test_retries_5xx_and_429(server, body):
+    server.respond(503, {"Retry-After": "0"})
+    server.respond(429, {"Retry-After": "0"})
+    server.respond(502)
+    uploader = _uploader(server)
+    try:
+        assert uploader.upload(body) == {"id": "remote-4"}
+    finally:
+        uploader.close()
+    assert len(server.requests) == 4
+
+
+def test_gives_up_after_max_retries(server, body):
+    server.respond(500, times=10)
+    uploader = _uploader(server, max_retries=2)
+    try:
+        with pytest.raises(RuntimeError, match="after 3 attempts: HTTP 500"):
+            uploader.upload(body)
+    finally:
+        uploader.close()
+    assert len(server.requests) == 3
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 422])
+def test_no_retry_on_4xx(server, body, status):
+    server.respond(status)
+    uploader = _uploader(server)
+    try:
+        with pytest.raises(RuntimeError, match=f"HTTP {status}"):
+            uploader.upload(body)
+    finally:
+        uploader.close()
+    assert len(server.requests) == 1
+
+
+def test_checkpoint_skips_uploaded_inputs_on_rerun(server, tmp_path, fixed_time):
+    rng = random.Random(2)
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (input_dir / name).write_text(json.dumps(benchmark.generate_aistudio_prompt(rng, chunks=4, text_size=50)),
+                                      encoding="utf-8")
+    output_dir = tmp_path / "out"
+    
+    def run():
+        # One upload at a time, so the scripted responses go to inputs in order
+        return converter.process_directory(str(input_dir), str(output_dir), workers=1, api_url=server.url,
+                                           api_key="secret", api_concurrency=1)
+    
+    # The first upload is retried; "b" fails for good and is not checkpointed
+    server.respond(503, {"Retry-After": "0"})
+    server.respond(200)
+    server.respond(400)
+    assert run() == (2, 1)
+    assert len(server.requests) == 4
+    checkpoint = converter.load_upload_checkpoint(str(output_dir))
+    assert sorted(name for name, _, _ in checkpoint) == ["a", "c"]
+    
+    # A rerun only uploads what failed, and then nothing at all
+    assert run() == (1, 0)
+    assert [request["body"]["chat"]["title"] for request in server.requests[4:]] == ["b"]
+    assert run() == (0, 0)
+    assert len(server.requests) == 5
+    
+    # A modified input is uploaded again
+    path = input_dir / "a"
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert run() == (1, 0)
+    assert len(server.requests) == 6